@@ -1,3 +1,116 @@
-from django.test import TestCase
+from unittest import mock
+from django.test import SimpleTestCase
+from personadjango.services.index import FileRanges
+from personadjango.services.answer_cache import AnswerCache
+from chat.views import ANSWER_CACHE_MODE as CHAT_MODE
+from chatbot.views import ANSWER_CACHE_MODE as CHATBOT_MODE
 
-# Create your tests here.
+class FileRangesTests(SimpleTestCase):
+    def setUp(self):
+        self.ranges = FileRanges({'b.txt': [11, 20], 'a.txt': [1, 10], 'c.txt': [25, 25]})
+
+    def test_ids_map_to_their_file(self):
+        self.assertEqual(self.ranges.file_name(1), 'a.txt')
+        self.assertEqual(self.ranges.file_name(10), 'a.txt')
+        self.assertEqual(self.ranges.file_name(11), 'b.txt')
+        self.assertEqual(self.ranges.file_name(20), 'b.txt')
+        self.assertEqual(self.ranges.file_name(25), 'c.txt')
+
+    def test_ids_outside_every_range_have_no_file(self):
+        self.assertIsNone(self.ranges.file_name(0))
+        self.assertIsNone(self.ranges.file_name(21))
+        self.assertIsNone(self.ranges.file_name(26))
+
+    def test_empty_ranges(self):
+        ranges = FileRanges({})
+        self.assertEqual(len(ranges), 0)
+        self.assertIsNone(ranges.file_name(1))
+
+    def test_length_counts_files(self):
+        self.assertEqual(len(self.ranges), 3)
+
+QUESTION_VECTORS = {
+    'what is the refund policy': [1.0, 0.0],
+    'what is your refund policy': [0.99, 0.1],
+    'how do i reset my password': [0.0, 1.0],
+}
+
+def fake_embed_text(brainName, question):
+    return QUESTION_VECTORS.get(" ".join(question.lower().split()).rstrip("?!. "))
+
+@mock.patch('personadjango.services.answer_cache.embed_text', fake_embed_text)
+class AnswerCacheTests(SimpleTestCase):
+    def put(self, cache, question, payload, index_version=1, language='en', brainName='brain', mode=CHAT_MODE):
+        cache.put(brainName, index_version, mode, question, language, 100, False, payload, cache.generation(brainName))
+
+    def get(self, cache, question, index_version=1, language='en', brainName='brain', mode=CHAT_MODE):
+        return cache.get(brainName, index_version, mode, question, language, 100, False)
+
+    def test_exact_hit_after_normalization(self):
+        cache = AnswerCache(max_entries=10, ttl=60, similarity_threshold=0)
+        self.put(cache, 'What is the refund policy?', {'answer': 'refund'})
+
+        self.assertEqual(self.get(cache, '  what is the   REFUND policy '), {'answer': 'refund'})
+        self.assertIsNone(self.get(cache, 'What is your refund policy?'))
+
+    def test_other_index_version_misses(self):
+        cache = AnswerCache(max_entries=10, ttl=60, similarity_threshold=0.9)
+        self.put(cache, 'What is the refund policy?', {'answer': 'refund'}, index_version=1)
+
+        self.assertIsNone(self.get(cache, 'What is the refund policy?', index_version=2))
+        self.assertIsNone(self.get(cache, 'What is your refund policy?', index_version=2))
+
+    def test_near_duplicate_hit_above_threshold(self):
+        cache = AnswerCache(max_entries=10, ttl=60, similarity_threshold=0.9)
+        self.put(cache, 'What is the refund policy?', {'answer': 'refund'})
+
+        self.assertEqual(self.get(cache, 'What is your refund policy?'), {'answer': 'refund'})
+        self.assertIsNone(self.get(cache, 'How do I reset my password?'))
+
+    def test_near_duplicate_needs_same_language_and_brain(self):
+        cache = AnswerCache(max_entries=10, ttl=60, similarity_threshold=0.9)
+        self.put(cache, 'What is the refund policy?', {'answer': 'refund'})
+
+        self.assertIsNone(self.get(cache, 'What is your refund policy?', language='fr'))
+        self.assertIsNone(self.get(cache, 'What is your refund policy?', brainName='other'))
+
+    def test_chatbot_answer_is_not_served_to_chat(self):
+        cache = AnswerCache(max_entries=10, ttl=60, similarity_threshold=0.9)
+        self.put(cache, 'What is the refund policy?', {'answer': 'general knowledge'}, mode=CHATBOT_MODE)
+
+        self.assertNotEqual(CHAT_MODE, CHATBOT_MODE)
+        self.assertIsNone(self.get(cache, 'What is the refund policy?', mode=CHAT_MODE))
+        self.assertIsNone(self.get(cache, 'What is your refund policy?', mode=CHAT_MODE))
+        self.assertEqual(self.get(cache, 'What is the refund policy?', mode=CHATBOT_MODE), {'answer': 'general knowledge'})
+
+    def test_invalidate_drops_answers_of_the_brain_only(self):
+        cache = AnswerCache(max_entries=10, ttl=60, similarity_threshold=0)
+        self.put(cache, 'What is the refund policy?', {'answer': 'refund'})
+        self.put(cache, 'What is the refund policy?', {'answer': 'other'}, brainName='other')
+        cache.invalidate('brain')
+
+        self.assertIsNone(self.get(cache, 'What is the refund policy?'))
+        self.assertEqual(self.get(cache, 'What is the refund policy?', brainName='other'), {'answer': 'other'})
+
+    def test_answer_generated_across_an_invalidation_is_not_stored(self):
+        cache = AnswerCache(max_entries=10, ttl=60, similarity_threshold=0)
+        generation = cache.generation('brain')
+        cache.invalidate('brain')
+        cache.put('brain', 1, CHAT_MODE, 'What is the refund policy?', 'en', 100, False, {'answer': 'stale'}, generation)
+
+        self.assertEqual(cache.generation('brain'), generation + 1)
+        self.assertIsNone(self.get(cache, 'What is the refund policy?'))
+
+    def test_expired_and_least_recently_used_answers_are_dropped(self):
+        cache = AnswerCache(max_entries=2, ttl=60, similarity_threshold=0)
+        self.put(cache, 'first', {'answer': 1})
+        self.put(cache, 'second', {'answer': 2})
+        self.get(cache, 'first')
+        self.put(cache, 'third', {'answer': 3})
+
+        self.assertEqual(self.get(cache, 'first'), {'answer': 1})
+        self.assertIsNone(self.get(cache, 'second'))
+
+        expired = AnswerCache(max_entries=2, ttl=-1, similarity_threshold=0)
+        self.put(expired, 'first', {'answer': 1})
+        self.assertIsNone(self.get(expired, 'first'))
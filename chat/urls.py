@@ -3,4 +3,6 @@ from . import views
 
 urlpatterns = [
     path('start', views.chat, name='chat'),
+    path('stream', views.chat_stream, name='chat_stream'),
+    path('async', views.chat_async, name='chat_async'),
 ]
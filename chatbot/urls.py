@@ -2,5 +2,7 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('start',views.chatbot, name='chatbot')
+    path('start',views.chatbot, name='chatbot'),
+    path('stream',views.chatbot_stream, name='chatbot_stream'),
+    path('async',views.chatbot_async, name='chatbot_async')
 ]
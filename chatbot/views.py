@@ -1,53 +1,269 @@
 from django.http import JsonResponse
+import asyncio
 import logging
-import os
-from threading import Lock
 from dotenv import load_dotenv
-from txtai.embeddings import Embeddings
-from django.conf import settings
-from personadjango.services.s3 import (
-                                download_files_from_s3                           
-                                )
 from personadjango.services.openai import (
-                                openai_gpt_chatbot,
-                                summarize_previous_qa,
+                                openai_gpt_chatbot_stream,
+                                async_openai_gpt_chatbot_stream,
                                 send_error,
-                                send_response
+                                send_response,
+                                send_stream_response
+                                )
+from personadjango.services.brains import (
+                                brain_stats,
+                                clear_brains,
+                                load_brain,
+                                search_brain
+                                )
+from personadjango.services.sessions import (
+                                open_session,
+                                session_events,
+                                async_record_session_turn
                                 )
-from personadjango.services.index import(
-                                delete_folder_content,
-                                read_file_index_ranges
+from personadjango.services.answer_cache import (
+                                get_cached_answer,
+                                get_answer_cache_generation,
+                                get_answer_cache_version,
+                                cache_answer
                                 )
-from personadjango.helper.text_extract import (
-                                search_file_name_from_index,
+from personadjango.helper.summarize import (
+                                summarize_previous_turn,
+                                async_summarize_previous_turn
                                 )
 from personadjango.helper.emotion import (
-                                get_emotion,
                                 get_voice_settings,
                                 detect_language,
                                 payload_return
                                 )
+from personadjango.services.parallel import (
+                                submit_stage,
+                                completed_stage,
+                                run_timed_stage_async,
+                                timed_stream
+                                )
 from django.views.decorators.csrf import csrf_exempt
 
-# Initialize a lock for controlling access to MASTER_EMBEDDING_ARRAY
-master_embedding_locks = {}
-
 # Load environment variables from a .env file
 load_dotenv()
 
-def get_lock_for_brain(brainName):
+# The chatbot may answer from general knowledge and skips the manipulation check, its cached
+# answers are never served to the chat API
+ANSWER_CACHE_MODE = 'chatbot'
+
+def parse_chatbot_request(request):
     """
-    Get or create a lock for a specific brain.
+    Read and validate the parameters of a chatbot request, handling the clear and display calls.
 
     Args:
-        brainName (str): The name of the brain.
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        tuple: (JsonResponse, None) when the request is already answered (errors, clear and
+               display calls), otherwise (None, dict) with the validated parameters.
+    """
+    if request.method != 'POST':
+        return send_error(data="Any method except POST is not not allowed", message="Method not allowed!", status=405), None
+
+    # Extract parameters from the POST request
+    llm = request.POST.get("llm")
+    brainName = request.POST.get('brainName')
+    question_asked = request.POST.get('current_user_question')
+    response_size = int(request.POST.get('word_limit', 30))
+    toxic_filter = request.POST.get('toxic_filter', 'False').lower() in ['true']
+    clear = request.POST.get('clear')
+    display = request.POST.get('display')
+    previous_question = request.POST.get('previous_question')
+    previous_answer = request.POST.get('previous_answer')
+    
+    # Clear the entire master embedding array if brainName is not specified
+    if clear == 'True' and brainName is None:
+        clear_brains()
+        return send_response(data="Cleared master_embedding_array completely", message="Cleared!"), None
+    
+    # Clear specific brain from master embedding array
+    if clear == 'True':
+        clear_brains(brainName)
+        return send_response(data=f"Cleared {brainName} from master_embedding_array", message="Cleared!"), None
+    
+    # Display the current master embedding array
+    if display == 'True':
+        logging.info("Returning loaded brains")
+        return send_response(data=brain_stats(), message="Displayed!"), None
+    
+    # Validate required parameters
+    if not llm or llm.split() == '':
+        logging.error("llm parameter cannot be empty")
+        return send_error(data=["llm parameter's value is empty, it should only be openai"], message="Value of llm parameter cannot be empty, it should be openai!"), None
+    if llm != "openai":
+        return send_error(data="llm value should only be openai", message="llm value should be openai!"), None
+    if not brainName or brainName.split() == '':
+        logging.error("brainName parameter cannot be empty")
+        return send_error(data=["brainName parameter's value is empty"], message="Value of brainName parameter cannot be empty!"), None
+    if not question_asked or question_asked.split() == '':
+        logging.error("current_user_question parameter cannot be empty")
+        return send_error(data="current_user_question parameter's value is empty", message="Value of current_user_question is empty!"), None
+    
+    # Ensure response size is within acceptable limits
+    if response_size is None:
+        response_size = 30
+    elif response_size < 10:
+        response_size = 15    
+
+    if toxic_filter:
+        toxic_filter = "For each identified toxic word in prompt, Strictly retain the first and last letter of the toxic word and replace all in-between letters of the toxic word with asterisks (*). Toxic words you must consider are profanity, swear words, hate speech, sexual content, violent and threatenining words, insults and slurs, vulgar expressions, sexual orientation (e.g., 'gay', 'lesbian'), disability, or appearance, inappropriate or disprespectful language (e.g., 'lazy ass'), and any other phrases considered rude, disrespectful, or hurtful in any social or cultural context."
+    else:
+        toxic_filter = None
+
+    logging.info(f"For BrainID - {brainName}, Chat API Called")
+    logging.info(f"For BrainID - {brainName}, Question Asked : {question_asked}")
+
+    # Conversations continue from the context stored with the session, unless the client sends the previous turn itself
+    session_id, session_context = open_session(request.POST.get('session_id'), brainName)
+    # Answers that depend on the previous turn are not cached
+    cacheable = not previous_question and not session_context
+
+    return None, {
+        'brainName': brainName,
+        'question_asked': question_asked,
+        'response_size': response_size,
+        'toxic_filter': toxic_filter,
+        'previous_question': previous_question,
+        'previous_answer': previous_answer,
+        'session_id': session_id,
+        'session_context': session_context,
+        'cacheable': cacheable,
+        'cache_generation': get_answer_cache_generation(brainName),
+        'cache_version': get_answer_cache_version(brainName) if cacheable else None,
+    }
+
+def lookup_cached_chatbot_answer(params):
+    """
+    Look up a cached answer for a chatbot request.
+
+    Args:
+        params (dict): The validated parameters returned by parse_chatbot_request.
+
+    Returns:
+        dict: The cached payload, or None if the request has to be answered.
+    """
+    if not params['cacheable']:
+        return None
+    language = detect_language(params['question_asked'])
+    return get_cached_answer(params['brainName'], params['cache_version'], ANSWER_CACHE_MODE, params['question_asked'], language, params['response_size'], params['toxic_filter'] is not None)
+
+def build_chatbot_query(question_asked, summarize_text, personality_name):
+    """
+    Build the txtai search query for a chatbot question.
+
+    Args:
+        question_asked (str): The current user question.
+        summarize_text (str): The summary of the previous question and answer.
+        personality_name (str): The personality name of the brain.
+
+    Returns:
+        str: The search query.
+    """
+    if "you" in question_asked.lower():
+        return question_asked + f"I am {personality_name}"
+    return summarize_text + question_asked
+
+def prepare_chatbot(request):
+    """
+    Validate a chatbot request, make sure the brain is in memory and run the retrieval.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
 
     Returns:
-        Lock: A lock object for the specified brain.
+        tuple: (JsonResponse, None) when the request is answered without an LLM reply
+               (errors, clear and display calls), otherwise (None, dict) with the chat context.
+    """
+    response, params = parse_chatbot_request(request)
+    if response is not None:
+        return response, None
+    brainName = params['brainName']
+    question_asked = params['question_asked']
+
+    # Repeated questions are answered from the cache, before any index or LLM work
+    cached_payload = lookup_cached_chatbot_answer(params)
+    if cached_payload is not None:
+        return None, {
+            'brainName': brainName,
+            'question_asked': question_asked,
+            'question_asked_txtai': question_asked,
+            'cached_payload': cached_payload,
+            'session_id': params['session_id'],
+            'conversation_context': "",
+        }
+
+    # Summarize the previous turn while the brain is loaded, a first question has nothing to summarize
+    if params['previous_question']:
+        summary_future = submit_stage(brainName, 'summarize_previous_qa', summarize_previous_turn, params['previous_question'], params['previous_answer'])
+    else:
+        summary_future = completed_stage(params['session_context'])
+
+    response, brain = load_brain(brainName)
+    if response is not None:
+        # Drops the summary if it has not started yet
+        summary_future.cancel()
+        return response, None
+    personality_name = brain['personality_name']
+
+    summarize_text = summary_future.result()
+    question_asked_txtai = build_chatbot_query(question_asked, summarize_text, personality_name)
+    try:
+        output = search_brain(brainName, question_asked_txtai)
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName},Query - {question_asked_txtai}, Failed Search On Embedding: {e}")
+        return send_error(data=str(e),message="Unable to generate response!", status=500), None
+
+    return None, {
+        'brainName': brainName,
+        'question_asked': question_asked,
+        'question_asked_txtai': question_asked_txtai,
+        'personality_name': personality_name,
+        'response_size': params['response_size'],
+        'output': output,
+        'toxic_filter': params['toxic_filter'],
+        'cacheable': params['cacheable'],
+        'cache_generation': params['cache_generation'],
+        'cache_version': params['cache_version'],
+        'session_id': params['session_id'],
+        'conversation_context': summarize_text,
+    }
+
+def chatbot_answer_events(context):
     """
-    if brainName not in master_embedding_locks:
-        master_embedding_locks[brainName] = Lock()
-    return master_embedding_locks[brainName]
+    Generate the answer for a prepared chatbot request.
+
+    Args:
+        context (dict): The chat context returned by prepare_chatbot.
+
+    Yields:
+        tuple: ('delta', str) for every piece of the answer as it is generated, then
+               ('done', dict) with the final payload_return payload.
+    """
+    brainName = context['brainName']
+    if context.get('cached_payload') is not None:
+        yield 'delta', context['cached_payload']['answer']
+        yield 'done', context['cached_payload']
+        return
+
+    question_asked = context['question_asked']
+    question_asked_log = context['question_asked_txtai']
+
+    answer = ""
+    reply_stream = openai_gpt_chatbot_stream(question_asked_log, context['personality_name'], context['response_size'], context['output'], question_asked, context['toxic_filter'])
+    for delta in timed_stream(brainName, 'answer_generation', reply_stream):
+        answer += delta
+        yield 'delta', delta
+    logging.info(f"For BrainID - {brainName}, For Question - {question_asked_log} ,Response Generated - '{answer}'")
+    
+    language = detect_language(question_asked)
+    payload = payload_return(answer, language)
+    if context['cacheable']:
+        cache_answer(brainName, context['cache_version'], ANSWER_CACHE_MODE, question_asked, language, context['response_size'], context['toxic_filter'] is not None, payload, context['cache_generation'])
+    yield 'done', payload
 
 @csrf_exempt
 def chatbot(request):
@@ -60,152 +276,110 @@ def chatbot(request):
     Returns:
         JsonResponse: The response containing the generated chat message or error.
     """
-    if request.method == 'POST':
-        # Extract parameters from the POST request
-        llm = request.POST.get("llm")
-        brainName = request.POST.get('brainName')
-        question_asked = request.POST.get('current_user_question')
-        response_size = int(request.POST.get('word_limit', 30))
-        toxic_filter = request.POST.get('toxic_filter', 'False').lower() in ['true']
-        clear = request.POST.get('clear')
-        display = request.POST.get('display')
-        previous_question = request.POST.get('previous_question')
-        previous_answer = request.POST.get('previous_answer')
-        
-        # Obtain the lock for the specific brainName
-        brain_lock = get_lock_for_brain(brainName)
-        
-        # Clear the entire master embedding array if brainName is not specified
-        if clear == 'True' and brainName is None:
-            with brain_lock:
-                settings.MASTER_EMBEDDING_ARRAY = {}
-                logging.info('Cleared master_embedding_array')
-            return send_response(data="Cleared master_embedding_array completely", message="Cleared!")
-        
-        # Clear specific brain from master embedding array
-        if clear == 'True':
-            with brain_lock:
-                settings.MASTER_EMBEDDING_ARRAY.pop(brainName, None)
-                logging.info(f"Cleared specific brain '{brainName}' from master_embedding array")
-            return send_response(data=f"Cleared {brainName} from master_embedding_array", message="Cleared!")
-        
-        # Display the current master embedding array
-        if display == 'True':
-            logging.info("Returning master_embedding_array")
-            return send_response(data=str(settings.MASTER_EMBEDDING_ARRAY), message="Displayed!")
-        
-        # Validate required parameters
-        if not llm or llm.split() == '':
-            logging.error("llm parameter cannot be empty")
-            return send_error(data=["llm parameter's value is empty, it should only be openai"], message="Value of llm parameter cannot be empty, it should be openai!")
-        if not brainName or brainName.split() == '':
-            logging.error("brainName parameter cannot be empty")
-            return send_error(data=["brainName parameter's value is empty"], message="Value of brainName parameter cannot be empty!")
-        if not question_asked or question_asked.split() == '':
-            logging.error("current_user_question parameter cannot be empty")
-            return send_error(data="current_user_question parameter's value is empty", message="Value of current_user_question is empty!")
-        
-        # Ensure response size is within acceptable limits
-        if response_size is None:
-            response_size = 30
-        elif response_size < 10:
-            response_size = 15    
-
-        logging.info(f"For BrainID - {brainName}, Chat API Called")
-        logging.info(f"For BrainID - {brainName}, Question Asked : {question_asked}")
-        
-        # Load personality name for the brain
-        try:
-            personality_name = read_file_index_ranges(brainName)['personality_name']
-            logging.info(f"For BrainID - {brainName}, Loaded Personality Name : {personality_name}")
-        except Exception as e:
-            logging.error(f"For BrainID - {brainName}, Failed to Load Personality Name")
-        
-        # Load file index ranges for the brain
-        try:
-            files_ranges = read_file_index_ranges(brainName)['files']
-            logging.info(f"For BrainID - {brainName}, Loaded File Index Ranges: {files_ranges}")
-        except Exception as e:
-            logging.error(f"For BrainID - {brainName}, Failed to Load File Index Ranges")
-        
-        # If the brain is not in memory, load it
-        if brainName not in settings.MASTER_EMBEDDING_ARRAY:
-            temp_folder_path = f"{os.environ.get('TEMP_CONNECTION_INDEX_STORAGE')}/{brainName}/"
-            if not os.path.exists(temp_folder_path):
-                os.makedirs(f'{temp_folder_path}')
-                logging.info(f'For BrainID - {brainName}, Temp Index Storage Allocated at - {temp_folder_path}')
-            try:
-                download_files_from_s3(os.environ.get('BUCKET_NAME'), (f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}"), temp_folder_path)
-                logging.info(f"For BrainID - {brainName}, Index File Content Downloaded From S3 Bucket to {temp_folder_path}")
-            except Exception as e:
-                logging.error(f"For BrainID - {brainName}, Failed To Download Index To {temp_folder_path} from S3 Bucket - {os.environ.get('BUCKET_NAME')}")
-                return send_error(data=str(e), message="Failed to load brain in memory!", status=500)
-
-            embedding_name = Embeddings(hybrid=True)
-            try:
-                embedding_name.load(temp_folder_path)
-                logging.info(f"For BrainID - {brainName}, Embedding Loaded From {temp_folder_path}")
-            except Exception as e:
-                logging.error(f"For BrainID - {brainName}, Failed To Load Embedding Index To {temp_folder_path}")
-                return send_error(data="Brain or Brain Index Does not exist", message="Brain does not exist!", status=404)
-
-            delete_folder_content(temp_folder_path)
-
-            with brain_lock:   # Ensure thread-safe access to MASTER_EMBEDDING_ARRAY
-                if len(settings.MASTER_EMBEDDING_ARRAY) == 0:
-                    settings.MASTER_EMBEDDING_ARRAY = {
-                        f'{brainName}': {
-                            f'{brainName}': embedding_name,
-                            f'personality_name': personality_name,
-                            f'files': files_ranges
-                        }
-                    }
-                else:       # Add the brain's embedding to the existing array
-                    settings.MASTER_EMBEDDING_ARRAY[brainName] = {
-                        f'{brainName}': embedding_name,
-                        f'personality_name': personality_name,
-                        f'files': files_ranges
-                    }
-                logging.info(f"For BrainID - {brainName}, Index Loaded In RunTime - {embedding_name}")
-
-        summarize_text = summarize_previous_qa(previous_question, previous_answer)  
-        toxic_filter_value = toxic_filter  
-        try:
-            if toxic_filter:
-                toxic_filter = "For each identified toxic word in prompt, Strictly retain the first and last letter of the toxic word and replace all in-between letters of the toxic word with asterisks (*). Toxic words you must consider are profanity, swear words, hate speech, sexual content, violent and threatenining words, insults and slurs, vulgar expressions, sexual orientation (e.g., 'gay', 'lesbian'), disability, or appearance, inappropriate or disprespectful language (e.g., 'lazy ass'), and any other phrases considered rude, disrespectful, or hurtful in any social or cultural context."
-            else:
-                toxic_filter = None
-        except Exception as e:
-            logging.error(f"Failed to Initialize toxic filter")
-        try:
-            with brain_lock:  # Ensure thread-safe search
-                output = " "
-                if "you" in question_asked.lower():
-                    question_asked_txtai = question_asked + f"I am {personality_name}"
-                else:
-                    question_asked_txtai = summarize_text + question_asked
-                res = settings.MASTER_EMBEDDING_ARRAY[brainName][brainName].search(question_asked_txtai, 7)
-                logging.info(f"For BrainID - {brainName}, Search Result : {res}")
-                dict = settings.MASTER_EMBEDDING_ARRAY[brainName]['files']
-                for i in range(0, len(res)):
-                    file_name = search_file_name_from_index(dict, int(res[i]['id']))
-                    output = output + (file_name) + " --> " + (res[i]['text']) + "\n"
-
-                question_asked_log  = question_asked_txtai
-                if llm == "openai" or llm is None:
-                    answer = openai_gpt_chatbot(question_asked_log, personality_name, response_size, output, question_asked, toxic_filter)
-                    logging.info(f"For BrainID - {brainName}, For Question - {question_asked_log} ,Response Generated - '{answer}'")
-                    
-                    emotion = get_emotion(answer)   # Analyze emotion of the answer
-                    language = detect_language(question_asked)
-                    payload_elevenlabs = payload_return(answer, emotion, language, toxic_filter_value)
-
-                    return send_response(data=payload_elevenlabs, message="Response Generated Successfully!")
-                else:
-                    return send_error(data="llm value should only be openai", message="llm value should be openai!")
-
-        except Exception as e:
-            logging.error(f"For BrainID - {brainName},Query - {question_asked_log}, Failed Search On Embedding {settings.MASTER_EMBEDDING_ARRAY[brainName]}")
-            return send_error(data=str(e),message="Unable to generate response!", status=500)
-    else:
-        return send_error(data="Any method except POST is not not allowed", message="Method not allowed!", status=405)
\ No newline at end of file
+    response, context = prepare_chatbot(request)
+    if response is not None:
+        return response
+
+    try:
+        for event, value in session_events(chatbot_answer_events(context), context):
+            if event == 'done':
+                return send_response(data=value, message="Response Generated Successfully!")
+    except Exception as e:
+        logging.error(f"For BrainID - {context['brainName']},Query - {context['question_asked_txtai']}, Failed To Generate Response: {e}")
+        return send_error(data=str(e),message="Unable to generate response!", status=500)
+
+@csrf_exempt
+def chatbot_stream(request):
+    """
+    Handle chatbot requests like chatbot, but stream the answer as server-sent events.
+
+    Validation errors are returned as regular JSON errors. Once the answer starts, 'delta'
+    frames carry the text as it is generated and a final 'done' frame carries the same
+    payload chatbot returns.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        StreamingHttpResponse: The text/event-stream response, or JsonResponse on error.
+    """
+    response, context = prepare_chatbot(request)
+    if response is not None:
+        return response
+    return send_stream_response(request, session_events(chatbot_answer_events(context), context), message="Response Generated Successfully!")
+
+async def chatbot_async_answer(brainName, params):
+    """
+    Run the chatbot pipeline on the event loop, with AsyncOpenAI for the LLM stages and
+    worker threads for the blocking index load and txtai search steps.
+
+    Args:
+        brainName (str): The name of the brain.
+        params (dict): The validated parameters returned by parse_chatbot_request.
+
+    Returns:
+        JsonResponse: The response containing the generated chat message or error.
+    """
+    question_asked = params['question_asked']
+
+    # Repeated questions are answered from the cache, before any index or LLM work
+    cached_payload = await asyncio.to_thread(lookup_cached_chatbot_answer, params)
+    if cached_payload is not None:
+        payload = await async_record_session_turn(params['session_id'], brainName, "", question_asked, cached_payload)
+        return send_response(data=payload, message="Response Generated Successfully!")
+
+    # Summarize the previous turn while the brain is loaded, a first question has nothing to summarize
+    summary_task = None
+    if params['previous_question']:
+        summary_task = asyncio.create_task(run_timed_stage_async(brainName, 'summarize_previous_qa', async_summarize_previous_turn(params['previous_question'], params['previous_answer'])))
+    try:
+        response, brain = await asyncio.to_thread(load_brain, brainName)
+        if response is not None:
+            return response
+        personality_name = brain['personality_name']
+        summarize_text = (await summary_task) if summary_task else params['session_context']
+    finally:
+        if summary_task is not None and not summary_task.done():
+            summary_task.cancel()
+
+    question_asked_txtai = build_chatbot_query(question_asked, summarize_text, personality_name)
+    try:
+        output = await asyncio.to_thread(search_brain, brainName, question_asked_txtai)
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName},Query - {question_asked_txtai}, Failed Search On Embedding: {e}")
+        return send_error(data=str(e),message="Unable to generate response!", status=500)
+
+    answer = ""
+    async for delta in async_openai_gpt_chatbot_stream(question_asked_txtai, personality_name, params['response_size'], output, question_asked, params['toxic_filter']):
+        answer += delta
+    logging.info(f"For BrainID - {brainName}, For Question - {question_asked_txtai} ,Response Generated - '{answer}'")
+
+    language = detect_language(question_asked)
+    payload = payload_return(answer, language)
+    if params['cacheable']:
+        await asyncio.to_thread(cache_answer, brainName, params['cache_version'], ANSWER_CACHE_MODE, question_asked, language, params['response_size'], params['toxic_filter'] is not None, payload, params['cache_generation'])
+    payload = await async_record_session_turn(params['session_id'], brainName, summarize_text, question_asked, payload)
+    return send_response(data=payload, message="Response Generated Successfully!")
+
+@csrf_exempt
+async def chatbot_async(request):
+    """
+    Handle chatbot requests like chatbot, as a native async view for ASGI deployments.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: The response containing the generated chat message or error.
+    """
+    # Parsing opens the session, a blocking store read
+    response, params = await asyncio.to_thread(parse_chatbot_request, request)
+    if response is not None:
+        return response
+
+    brainName = params['brainName']
+    try:
+        return await chatbot_async_answer(brainName, params)
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName}, Failed To Generate Response: {e}")
+        return send_error(data=str(e),message="Unable to generate response!", status=500)
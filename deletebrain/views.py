@@ -1,5 +1,4 @@
 import logging
-from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from personadjango.services.s3 import (
@@ -10,6 +9,10 @@ from personadjango.services.openai import (
                                 send_error,
                                 send_response
                                 )
+from personadjango.services.brains import clear_brains
+from personadjango.services.answer_cache import invalidate_cached_answers
+from personadjango.services.index_cache import index_disk_cache
+from personadjango.services.index_versions import remote_metadata
 @csrf_exempt
 def deletebrain(request):
     """
@@ -30,9 +33,14 @@ def deletebrain(request):
         logging.error("Brain name is required but was not provided")
         return send_error(data=["brainName parameter value is empty"], message="Empty Parameter: brainName!")
 
+    invalidate_cached_answers(brainName)
+    index_disk_cache.evict(brainName)
+    remote_metadata.invalidate(brainName)
+
     # # Attempt to delete the brain from RAM
     try:
-        del settings.MASTER_EMBEDDING_ARRAY[brainName]
+        if not clear_brains(brainName):
+            raise KeyError(brainName)
         logging.info(f"For BrainID - {brainName}, Runtime Index deleted from memory")
     except KeyError:
         logging.warning(f"For BrainID - {brainName}, Runtime Index not present in memory")
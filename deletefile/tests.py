@@ -1,3 +1,43 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
+from personadjango.services.index import FileRanges
+from personadjango.services.segments import SegmentedIndex
 
-# Create your tests here.
+class FakeIndex:
+    """
+    Stands in for a txtai index, its documents scored in decreasing order of id position.
+    """
+    def __init__(self, ids):
+        self.ids = ids
+        self.limits = []
+
+    def search(self, query, limit):
+        self.limits.append(limit)
+        return [{'id': str(key), 'score': 1.0 - position / 1000} for position, key in enumerate(self.ids)][:limit]
+
+    def count(self):
+        return len(self.ids)
+
+class SegmentedIndexSearchTests(SimpleTestCase):
+    def test_tombstoned_top_hits_are_replaced_by_live_ones(self):
+        # Ids 1-50 belonged to a deleted file and are still the best hits of the base
+        base = FakeIndex(list(range(1, 61)))
+        index = SegmentedIndex(base, [], FileRanges({'kept.txt': [51, 60]}))
+        hits = index.search('query', 5)
+
+        self.assertEqual([int(hit['id']) for hit in hits], [51, 52, 53, 54, 55])
+        self.assertGreater(len(base.limits), 1)
+
+    def test_exhausted_index_returns_its_live_hits(self):
+        base = FakeIndex(list(range(1, 21)))
+        index = SegmentedIndex(base, [], FileRanges({'kept.txt': [19, 20]}))
+
+        self.assertEqual([int(hit['id']) for hit in index.search('query', 5)], [19, 20])
+
+    def test_hits_of_segments_are_merged_by_score(self):
+        base = FakeIndex([1, 2, 3])
+        delta = FakeIndex([4, 5])
+        index = SegmentedIndex(base, [delta], FileRanges({'base.txt': [1, 3], 'delta.txt': [4, 5]}))
+        hits = index.search('query', 3)
+
+        self.assertEqual([int(hit['id']) for hit in hits], [1, 4, 2])
+        self.assertEqual(base.limits, [6])
@@ -12,13 +12,20 @@ from personadjango.services.s3 import (
 from personadjango.services.index import (
                                 read_file_index_ranges, 
                                 save_file_index_ranges, 
+                                bump_index_version,
                                 delete_folder_content
                                 )
 from personadjango.services.openai import (
                                 send_error,
                                 send_response
                                 )
+from personadjango.services.answer_cache import invalidate_cached_answers
 from personadjango.embeddings import delete_embedding_data
+from personadjango.services.segments import (
+                                SEGMENTED_INDEX,
+                                schedule_compaction,
+                                tombstone_files
+                                )
 
 load_dotenv()
 
@@ -44,6 +51,10 @@ def del_file(request):
         logging.error("Brain name and file names are required")
         return send_error(data=["brainName or file_names parameter value is empty"], message="Empty parameter: brainName or file_names!")
     
+    # Segmented brains record tombstones, their index is not downloaded
+    if SEGMENTED_INDEX:
+        return del_segmented_files(brainName, file_names)
+
     # Define the temporary index path for storing downloaded files
     temp_index_path = os.path.join(os.environ.get('TEMP_INDEX_STORAGE'), brainName)
     os.makedirs(temp_index_path, exist_ok=True)
@@ -61,35 +72,90 @@ def del_file(request):
     deleted_files = []
     not_present_files = []
     
-    # Loop through the list of files to be deleted
-    for file_name in file_names:
+    # Collect the id ranges of every requested file, they are removed from the index together
+    ranges = []
+    for file_name in dict.fromkeys(file_names):
         if file_name in files_to_delete:
-            start_val, end_val = files_to_delete[file_name]
-            delete_embedding_data(start_val, end_val, temp_index_path, brainName)
-            del file_index_ranges['files'][file_name]
-            delete_file_from_s3(brainName, file_name)
+            ranges.append(files_to_delete[file_name])
             deleted_files.append(file_name)
         else:
             not_present_files.append(file_name)
     
     # If files were successfully deleted, update the index and upload changes to S3
+    removed_ids = 0
     if deleted_files:
+        try:
+            removed_ids = delete_embedding_data(ranges, temp_index_path, brainName)
+        except Exception as e:
+            delete_folder_content(temp_index_path)
+            return send_error(data=[str(e)], message="Deletion of file information from brain failed!", status=500)
+        for file_name in deleted_files:
+            del file_index_ranges['files'][file_name]
+            delete_file_from_s3(brainName, file_name)
+
         try:
             upload_folder_to_s3(os.environ.get('BUCKET_NAME'), temp_index_path, f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}")
             save_file_index_ranges(brainName, file_index_ranges)
+            # Workers serving the brain reload it when they see the new version
+            bump_index_version(brainName)
             upload_content_from_fileindexrange_to_s3(brainName)
         except Exception as e:
             logging.error("Failed during the file update process after deletion")
             return send_error(data=[str(e)], message="Update processing of information of brain after deletion failed!", status=500)
+        finally:
+            # Answers generated before the deletion may quote the removed files
+            invalidate_cached_answers(brainName)
         
     # Clean up the temporary directory
     delete_folder_content(temp_index_path)
 
-    # Return the appropriate response
+    return deletion_response(deleted_files, not_present_files, removed_ids)
+
+def del_segmented_files(brainName, file_names):
+    """
+    Delete files from a segmented brain by tombstoning their ids, see services/segments.py.
+
+    Args:
+        brainName (str): The name of the brain.
+        file_names (list): The files to delete.
+
+    Returns:
+        JsonResponse: The response indicating the success or failure of file deletion.
+    """
+    try:
+        deleted_files, removed_ids = tombstone_files(brainName, file_names)
+        for file_name in deleted_files:
+            delete_file_from_s3(brainName, file_name)
+        if deleted_files:
+            # tombstone_files bumped the index version, workers serving the brain reload it
+            upload_content_from_fileindexrange_to_s3(brainName)
+            schedule_compaction(brainName)
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName}, Failed to tombstone deleted files: {e}")
+        return send_error(data=[str(e)], message="Update processing of information of brain after deletion failed!", status=500)
+    finally:
+        # Answers generated before the deletion may quote the removed files
+        invalidate_cached_answers(brainName)
+
+    not_present_files = [file_name for file_name in dict.fromkeys(file_names) if file_name not in deleted_files]
+    return deletion_response(deleted_files, not_present_files, removed_ids)
+
+def deletion_response(deleted_files, not_present_files, removed_ids):
+    """
+    Build the response of a file deletion.
+
+    Args:
+        deleted_files (list): The files deleted from the brain.
+        not_present_files (list): The requested files the brain did not have.
+        removed_ids (int): The number of index entries removed or tombstoned.
+
+    Returns:
+        JsonResponse: 404 if none of the files were present, otherwise the deletion summary.
+    """
     if not_present_files and not deleted_files:
         return send_error(data=[f"Not present: {', '.join(not_present_files)}"], message="File not Found!", status=404)
     else:
-        message = f"Deleted successfully: {', '.join(deleted_files)}"
+        message = f"Deleted successfully: {', '.join(deleted_files)} ({removed_ids} index entries removed)"
         if not_present_files:
             message += f".  Not present: {', '.join(not_present_files)}"
         return send_response(data=[message], message="Operation completed successfully!")
@@ -1,11 +1,11 @@
 import logging
-from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from personadjango.services.openai import (
                             send_error,
                             send_response
                             )
+from personadjango.services.brains import clear_brains
 @csrf_exempt
 def del_embedding_from_runtime(request):
     """
@@ -26,7 +26,7 @@ def del_embedding_from_runtime(request):
     # If brainName is not provided, clear all brain indexes from memory
     if not brainName:
         try:
-            settings.MASTER_EMBEDDING_ARRAY = {}
+            clear_brains()
             logging.info("All Brain Indexes Removed From Memory")
             return send_response(data=["All brain indexes removed from memory."], message="Cleared!")
         except Exception as e:
@@ -35,7 +35,8 @@ def del_embedding_from_runtime(request):
     else:
         logging.info(f"For BrainID - {brainName}, Delete Runtime Index API Called")
         try:
-            del settings.MASTER_EMBEDDING_ARRAY[brainName]
+            if not clear_brains(brainName):
+                raise KeyError(brainName)
             logging.info(f"Runtime index for '{brainName}' deleted from memory")
             return send_response(data=[f"Runtime index for '{brainName}' deleted from memory."], message="Cleared!")
         except KeyError:
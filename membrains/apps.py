@@ -1,6 +1,17 @@
+import sys
 from django.apps import AppConfig
 
 
 class MembrainsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'membrains'
+
+    def ready(self):
+        # Prewarm in the server processes only, not for migrate or other management commands
+        if len(sys.argv) > 1 and sys.argv[0].endswith('manage.py') and sys.argv[1] != 'runserver':
+            return
+        from personadjango.services.brains import check_lazy_load
+        from personadjango.services.prewarm import PREWARM_ON_STARTUP, start_prewarm
+        check_lazy_load()
+        if PREWARM_ON_STARTUP:
+            start_prewarm()
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from personadjango.services.index_cache import INDEX_DISK_CACHE_ENABLED
+from personadjango.services.prewarm import (
+                                PREWARM_TOP_BRAINS,
+                                PREWARM_WORKERS,
+                                prewarm_brain_names,
+                                prewarm_brains,
+                                warm_brain_on_disk
+                                )
+
+class Command(BaseCommand):
+    """
+    Fetch the indexes of the hot brains into the disk cache before the server starts.
+
+    A management command runs in its own process, so it cannot fill the workers' memory.
+    It downloads the indexes instead, and the workers' first load of those brains reads
+    them from disk. Set PREWARM_ON_STARTUP for the workers to also load them in memory.
+    """
+    help = 'Fetch the configured or most used brain indexes into the local disk cache.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('brains', nargs='*', help='Brains to prewarm, PREWARM_BRAINS when omitted.')
+        parser.add_argument('--top', type=int, default=PREWARM_TOP_BRAINS, help='Also prewarm this many of the most used brains.')
+        parser.add_argument('--workers', type=int, default=PREWARM_WORKERS, help='Brains fetched at the same time.')
+
+    def handle(self, *args, **options):
+        if not INDEX_DISK_CACHE_ENABLED:
+            raise CommandError('The index disk cache is disabled, set INDEX_DISK_CACHE_ENABLED=True to prewarm brains.')
+
+        brainNames = prewarm_brain_names(options['brains'] or None, options['top'])
+        if not brainNames:
+            self.stdout.write('No brains to prewarm.')
+            return
+
+        failed = prewarm_brains(brainNames, options['workers'], warm=warm_brain_on_disk)
+        for brainName, error in failed.items():
+            self.stderr.write(f'{brainName}: {error}')
+        self.stdout.write(f'Prewarmed {len(brainNames) - len(failed)} of {len(brainNames)} brains.')
+        if failed:
+            raise CommandError(f'{len(failed)} brains could not be prewarmed.')
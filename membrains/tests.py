@@ -1,3 +1,295 @@
-from django.test import TestCase
+import os
+import time
+import tempfile
+from unittest import mock
+from threading import Event, Thread
+from django.test import SimpleTestCase
+from personadjango.services.brain_cache import BrainCache
+from personadjango.services.parallel import SingleFlight
+from personadjango.services.index_cache import IndexDiskCache
+from personadjango.services.embedding_models import Embeddings, EmbeddingModelRegistry
+from personadjango.services import brains
 
-# Create your tests here.
+class FakeEmbeddings:
+    """
+    Stands in for a loaded txtai index, recording whether it was closed.
+    """
+    def __init__(self, vectors=10):
+        self.vectors = vectors
+        self.closed = False
+
+    def count(self):
+        return self.vectors
+
+    def close(self):
+        self.closed = True
+
+class BrainCacheEvictionTests(SimpleTestCase):
+    def test_least_recently_used_brain_is_evicted_over_budget(self):
+        cache = BrainCache(max_bytes=250, idle_ttl=0)
+        first, second, third = FakeEmbeddings(), FakeEmbeddings(), FakeEmbeddings()
+        cache.put('first', first, 'First', {}, 100)
+        cache.put('second', second, 'Second', {}, 100)
+        with cache.use('first'):
+            pass
+        cache.put('third', third, 'Third', {}, 100)
+
+        self.assertEqual(cache.names(), ['first', 'third'])
+        self.assertTrue(second.closed)
+        self.assertFalse(first.closed)
+        self.assertEqual(cache.total_bytes(), 200)
+
+    def test_brain_just_stored_stays_even_over_budget(self):
+        cache = BrainCache(max_bytes=50, idle_ttl=0)
+        cache.put('small', FakeEmbeddings(), 'Small', {}, 40)
+        cache.put('large', FakeEmbeddings(), 'Large', {}, 100)
+
+        self.assertEqual(cache.names(), ['large'])
+
+    def test_idle_brains_are_evicted(self):
+        cache = BrainCache(max_bytes=1000, idle_ttl=60)
+        idle, active = FakeEmbeddings(), FakeEmbeddings()
+        cache.put('idle', idle, 'Idle', {}, 10)
+        cache.put('active', active, 'Active', {}, 10)
+        cache.entries['idle']['last_access'] = time.time() - 120
+        cache.evict_idle()
+
+        self.assertEqual(cache.names(), ['active'])
+        self.assertTrue(idle.closed)
+        self.assertFalse(active.closed)
+
+    def test_idle_ttl_of_zero_keeps_brains(self):
+        cache = BrainCache(max_bytes=1000, idle_ttl=0)
+        cache.put('brain', FakeEmbeddings(), 'Brain', {}, 10)
+        cache.entries['brain']['last_access'] = 0
+        cache.evict_idle()
+
+        self.assertEqual(cache.names(), ['brain'])
+
+    def test_stats_report_totals(self):
+        cache = BrainCache(max_bytes=1000, idle_ttl=0)
+        cache.put('first', FakeEmbeddings(vectors=3), 'First', {'a.txt': [1, 3]}, 10, version=2)
+        cache.put('second', FakeEmbeddings(vectors=4), 'Second', {}, 20)
+        with cache.use('first'):
+            pass
+        stats = cache.stats()
+
+        self.assertEqual(stats['brains']['first']['version'], 2)
+        self.assertEqual(stats['brains']['first']['files'], 1)
+        self.assertEqual(stats['brains']['first']['hits'], 1)
+        self.assertEqual(stats['totals']['brains'], 2)
+        self.assertEqual(stats['totals']['bytes'], 30)
+        self.assertEqual(stats['totals']['vectors'], 7)
+
+class BrainCachePinTests(SimpleTestCase):
+    def test_replaced_index_is_closed_after_its_searches(self):
+        cache = BrainCache(max_bytes=1000, idle_ttl=0)
+        old, new = FakeEmbeddings(), FakeEmbeddings()
+        cache.put('brain', old, 'Brain', {}, 10, version=1)
+        with cache.use('brain') as entry:
+            cache.put('brain', new, 'Brain', {}, 10, version=2)
+            self.assertIs(entry['embeddings'], old)
+            self.assertFalse(old.closed)
+            self.assertEqual(cache.loaded_version('brain'), 2)
+            self.assertEqual(cache.stats()['totals']['draining'], 1)
+        self.assertTrue(old.closed)
+        self.assertFalse(new.closed)
+        self.assertEqual(cache.stats()['totals']['draining'], 0)
+
+    def test_unused_index_is_closed_on_replace(self):
+        cache = BrainCache(max_bytes=1000, idle_ttl=0)
+        old = FakeEmbeddings()
+        cache.put('brain', old, 'Brain', {}, 10, version=1)
+        cache.put('brain', FakeEmbeddings(), 'Brain', {}, 10, version=2)
+
+        self.assertTrue(old.closed)
+
+    def test_pinned_index_survives_pop_until_released(self):
+        cache = BrainCache(max_bytes=1000, idle_ttl=0)
+        embeddings = FakeEmbeddings()
+        cache.put('brain', embeddings, 'Brain', {}, 10)
+        with cache.use('brain'):
+            with cache.use('brain'):
+                self.assertTrue(cache.pop('brain'))
+                self.assertFalse(cache.contains('brain'))
+            self.assertFalse(embeddings.closed)
+        self.assertTrue(embeddings.closed)
+
+    def test_use_of_missing_brain_yields_none(self):
+        cache = BrainCache(max_bytes=1000, idle_ttl=0)
+        with cache.use('missing') as entry:
+            self.assertIsNone(entry)
+        self.assertFalse(cache.pop('missing'))
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        started, release = Event(), Event()
+        calls = []
+        results = []
+
+        def load():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'index'
+
+        leader = Thread(target=lambda: results.append(flight.run('brain', load)))
+        leader.start()
+        self.assertTrue(started.wait(5))
+        followers = [Thread(target=lambda: results.append(flight.run('brain', load))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        while flight.stats()['coalesced_waits'] < 3:
+            time.sleep(0.01)
+        self.assertEqual(flight.in_flight(), ['brain'])
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['index'] * 4)
+        self.assertEqual(flight.in_flight(), [])
+        self.assertEqual(flight.stats()['calls'], 1)
+
+    def test_exception_reaches_waiters_and_next_call_runs_again(self):
+        flight = SingleFlight()
+        started, release = Event(), Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError('download failed')
+
+        def call():
+            try:
+                flight.run('brain', fail)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [Thread(target=call)]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        threads.append(Thread(target=call))
+        threads[1].start()
+        while flight.stats()['coalesced_waits'] < 1:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(errors, ['download failed'] * 2)
+        self.assertEqual(flight.stats()['failures'], 1)
+        self.assertEqual(flight.run('brain', lambda: 'retried'), 'retried')
+
+    def test_different_keys_do_not_wait_for_each_other(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.run('first', lambda: flight.run('second', lambda: 2) + 1), 3)
+        self.assertEqual(flight.stats()['coalesced_waits'], 0)
+
+class IndexDiskCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.cache = IndexDiskCache(os.path.join(self.folder.name, 'cache'), 10 ** 9)
+        self.objects = {
+            'index/brain/config': {'etag': 'config-1', 'size': 10},
+            'index/brain/embeddings': {'etag': 'vectors-1', 'size': 10},
+            'index/brain/brain.json': {'etag': 'metadata-1', 'size': 10},
+        }
+        self.downloads = []
+        patches = [
+            mock.patch.dict(os.environ, {'BUCKET_NAME': 'bucket', 'S3_MASTER_INDEX_REPO': 'index'}),
+            mock.patch('personadjango.services.index_cache.list_s3_folder_files', lambda bucket, prefix: dict(self.objects)),
+            mock.patch('personadjango.services.index_cache.download_s3_files', self.download),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def download(self, bucket, keys, folder):
+        self.downloads.append(sorted(keys))
+        for key in keys:
+            with open(os.path.join(folder, os.path.basename(key)), 'w') as file:
+                file.write(self.objects[key]['etag'])
+
+    def test_metadata_change_alone_is_served_from_cache(self):
+        first = self.cache.fetch('brain')
+        self.objects['index/brain/brain.json'] = {'etag': 'metadata-2', 'size': 12}
+        second = self.cache.fetch('brain')
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.downloads, [['index/brain/config', 'index/brain/embeddings']])
+        self.assertFalse(os.path.exists(os.path.join(first, 'brain.json')))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_index_file_change_downloads_a_new_version(self):
+        first = self.cache.fetch('brain')
+        self.objects['index/brain/embeddings'] = {'etag': 'vectors-2', 'size': 10}
+        second = self.cache.fetch('brain')
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(len(self.downloads), 2)
+        self.assertFalse(os.path.exists(first))
+
+    def test_segment_add_downloads_only_the_segment(self):
+        segment_downloads = []
+
+        def download_segment(bucket, prefix, folder):
+            segment_downloads.append(prefix)
+            with open(os.path.join(folder, 'embeddings'), 'w') as file:
+                file.write('segment')
+
+        base = self.cache.fetch('brain')
+        # An append uploads a delta segment and the brain metadata, the base index files are unchanged
+        self.objects['index/brain/brain.json'] = {'etag': 'metadata-2', 'size': 14}
+        with mock.patch('personadjango.services.index_cache.download_files_from_s3', download_segment):
+            self.assertEqual(self.cache.fetch('brain'), base)
+            segment = self.cache.fetch_segment('brain', 'segment-1')
+
+        self.assertEqual(len(self.downloads), 1)
+        self.assertEqual(len(segment_downloads), 1)
+        self.assertTrue(segment_downloads[0].endswith('/brain/segment-1/'))
+        self.assertTrue(os.path.isdir(segment))
+
+class EmbeddingModelRegistryTests(SimpleTestCase):
+    def test_concurrent_cold_loads_share_one_model(self):
+        loads = []
+
+        def load_model(index):
+            # Mimics txtai, the model is looked up in the shared cache and loaded when missing
+            if 'model' not in index.models:
+                time.sleep(0.05)
+                loads.append(1)
+                index.models['model'] = object()
+            return index.models['model']
+
+        registry = EmbeddingModelRegistry(True)
+        models = []
+        with mock.patch.object(Embeddings, 'loadvectors', load_model):
+            brains = [registry.embeddings(), registry.embeddings()]
+            threads = [Thread(target=lambda index=index: models.append(index.loadvectors())) for index in brains]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len(models), 2)
+        self.assertIs(models[0], models[1])
+        self.assertEqual(registry.names(), ['model'])
+
+class LazyLoadSettingTests(SimpleTestCase):
+    @mock.patch.object(brains, 'BRAIN_LAZY_LOAD', True)
+    @mock.patch.object(brains, 'INDEX_DISK_CACHE_ENABLED', False)
+    def test_lazy_load_without_disk_cache_warns(self):
+        with self.assertLogs(level='WARNING'):
+            self.assertFalse(brains.check_lazy_load())
+
+    @mock.patch.object(brains, 'BRAIN_LAZY_LOAD', True)
+    @mock.patch.object(brains, 'INDEX_DISK_CACHE_ENABLED', True)
+    def test_lazy_load_with_disk_cache(self):
+        self.assertTrue(brains.check_lazy_load())
@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('start', views.membrains, name='membrains'),
+    path('ready', views.ready, name='ready'),
 ]
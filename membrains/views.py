@@ -1,32 +1,51 @@
 import logging
 from django.views.decorators.csrf import csrf_exempt
-from django.conf import settings
 from django.shortcuts import render
 from django.http import JsonResponse
 from personadjango.services.openai import (
                                     send_error,
                                     send_response
                                 )
+from personadjango.services.brains import brain_stats
+from personadjango.services.prewarm import readiness
 @csrf_exempt
 def membrains(request):
     """
-    Retrieves and returns `settings.MASTER_EMBEDDING_ARRAY` as a JSON response for GET requests.
+    Returns the memory and usage stats of the brains loaded by this worker for GET requests.
 
     Args:
         request (HttpRequest): The HTTP request object.
 
     Returns:
-        JsonResponse: JSON response containing the master embedding array data or an error message.
+        JsonResponse: JSON response containing the per-brain and process stats or an error message.
     """
     if request.method == 'GET':
         try:
-            logging.info("Returning master_embedding_array")
-            # Convert the embedding array to a string representation for the response if needed
-            embedding_info = str(settings.MASTER_EMBEDDING_ARRAY)  # Assuming this is how you want to display the data
-            return send_response(data=[embedding_info], message="Displayed!")
+            logging.info("Returning brain stats")
+            return send_response(data=brain_stats(), message="Displayed!")
         except Exception as e:
-            logging.error("Failed to retrieve master_embedding_array")
-            return send_error(data=["Failed to retrieve master embedding array"], message="Failed to display!", status=500)
+            logging.error(f"Failed to collect brain stats: {e}")
+            return send_error(data=["Failed to collect brain stats"], message="Failed to display!", status=500)
     else:
         logging.error("Method not allowed for the requested operation")
         return send_error(data=["Any method beside POST is not allowed"], message="Method not allowed!", status=405)
+
+@csrf_exempt
+def ready(request):
+    """
+    Report whether this worker finished prewarming its brains, for load balancer health checks.
+
+    Args:
+        request (HttpRequest): The HTTP request object.
+
+    Returns:
+        JsonResponse: 200 with the warm and loading brains once prewarming is done, 503 before.
+    """
+    if request.method != 'GET':
+        logging.error("Method not allowed for the requested operation")
+        return send_error(data=["Any method beside GET is not allowed"], message="Method not allowed!", status=405)
+
+    state = readiness()
+    if not state['ready']:
+        return send_error(data=state, message="Not ready!", status=503)
+    return send_response(data=state, message="Ready!")
@@ -1,67 +1,155 @@
+import os
+import shutil
 from django.shortcuts import render
 from django.http import JsonResponse
-from txtai.embeddings import Embeddings
+from dotenv import load_dotenv
 import logging
 from .services.index import (
                     read_file_index_ranges,
                     save_file_index_ranges,
+                    bump_index_version,
+                    )
+from .services.embedding_models import (
+                    embedding_models
+                    )
+from .services.segments import (
+                    add_delta_segment,
+                    segment_write_lock
                     )
 from .services.openai import (
-                    send_response,
-                    send_error
+                    send_response
                     )
 from .helper.text_extract import (
                     split_text,
                     )
 
-def append_new_embedding_data_to_brain(filename,content,source_fold,temp_index_path,brainName):
+load_dotenv()
+
+# Chunks encoded and added to the index together by one upsert call
+UPSERT_BATCH_SIZE = int(os.environ.get('UPSERT_BATCH_SIZE', 64))
+
+def batched_chunks(word_chunks, first_index, batch_size):
     """
-    Appends new embedding data to the brain.
-    
-    Args: 
-        filename (str): The name of the file containing the new data.
-        content (str): The content to be embedded.
-        source_fold (str): The source folder path.
-        temp_index_path (str): The path of the temporary index file.
+    Turn word chunks into numbered txtai documents, yielded in batches.
+
+    Args:
+        word_chunks (list): The chunks, each a list of words.
+        first_index (int): The id of the first chunk.
+        batch_size (int): The number of documents per batch.
+
+    Yields:
+        list: Up to batch_size (id, text, tags) tuples.
+    """
+    batch = []
+    for counter_index, words in enumerate(word_chunks, start=first_index):
+        batch.append((counter_index, " ".join(words) + " ", "filename"))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def append_files_to_brain(file_texts,temp_index_path,brainName,create=False,batch_size=UPSERT_BATCH_SIZE):
+    """
+    Adds several files to the brain index with one load and one save.
+
+    Args:
+        file_texts (list): (filename, content) pairs of the files to add.
+        temp_index_path (str): The folder of the downloaded index, the index is saved back to it.
         brainName (str): The name of the brain to update.
-        
+        create (bool, optional): Build a new index in temp_index_path instead, for a brain without content.
+        batch_size (int, optional): The number of chunks encoded and upserted together.
+
     Returns:
-        JsonResponse: Error response if embedding loading or appending fails.
-    """
+        dict: The [first, last] id range of each file.
 
-    word_chunks = split_text(content, 100)
-    for i in range(len( word_chunks)):
-        string=""
-        for x in word_chunks[i]:
-            string = string+x+" "
-        word_chunks[i] =string
-    temp_dict = (read_file_index_ranges(brainName))
-    counter_index = temp_dict['last_index']
-    first_index = counter_index+1
+    Raises:
+        Exception: If the index could not be loaded, appended to or saved.
+    """
+    temp_dict = read_file_index_ranges(brainName)
+    if create:
+        # A new brain's index and ranges start over, as in create_embeddings
+        temp_dict['files'] = {}
+        counter_index = 0
+    else:
+        counter_index = temp_dict['last_index']
 
-    embedding = Embeddings(hybrid =True,content=True)
+    embedding = embedding_models.embeddings(hybrid=True, content=True)
+    if not create:
+        try:
+            embedding.load(temp_index_path)
+            logging.info(f"For BrainID - {brainName}, Embedding Loaded From {temp_index_path}")
+        except Exception:
+            logging.error(f"For BrainID - {brainName}, Failed To Load Embedding Index To {temp_index_path}")
+            raise
 
+    file_ranges = {}
+    documents = 0
     try:
-        embedding.load(temp_index_path)
-        logging.info(f"For BrainID - {brainName}, Embedding Loaded From {temp_index_path}")
-    except Exception as e:
-        logging.error(f"For BrainID - {brainName}, Failed To Load Embedding Index To {temp_index_path}")
-        return send_error(data=[str(e)], message= "Failed to load information to server", status=500)
+        for filename, content in file_texts:
+            first_index = counter_index+1
+            for batch in batched_chunks(split_text(content, 100), first_index, max(batch_size, 1)):
+                # Upsert builds the index on the first batch of a new brain
+                embedding.upsert(batch)
+                counter_index = batch[-1][0]
+                documents += len(batch)
+            file_ranges[filename] = [first_index, counter_index]
+        embedding.save(temp_index_path)
+    finally:
+        embedding.close()
+    logging.info(f"For BrainID - {brainName}, {documents} chunks of {len(file_ranges)} files added to {temp_index_path}")
 
-    try:
-        for x in word_chunks:
-            counter_index+=1
-            embedding.upsert([(counter_index,x,"filename")])
-    except Exception as e:
-        logging.error(f'error : {str(e)}')
-        return send_error(data=str(e), message="Failed to append information",status=500)
-    
     temp_dict['last_index'] = counter_index
-    file_dict = temp_dict['files'] 
-    file_dict[f'{filename}'] = [first_index,counter_index]
-    temp_dict['files'] = file_dict
-    embedding.save(temp_index_path)
+    temp_dict['files'].update(file_ranges)
     save_file_index_ranges(brainName,temp_dict)
+    return file_ranges
+
+
+def append_segment_to_brain(file_texts,temp_index_path,brainName):
+    """
+    Index new files as a delta segment of a segmented brain, without downloading its index.
+
+    The file ranges, the segment and the index version bump are written in one locked update.
+
+    Args:
+        file_texts (list): (filename, content) pairs of the files to add.
+        temp_index_path (str): An empty folder to build the segment in, removed afterwards.
+        brainName (str): The name of the brain to update.
+
+    Returns:
+        dict: The new segment entry, or None if the files had no text to index.
+    """
+    # Ids are handed out under the brain's write lock, so concurrent uploads and compactions never overlap
+    with segment_write_lock(brainName):
+        temp_dict = read_file_index_ranges(brainName)
+        counter_index = temp_dict['last_index']
+        first_segment_index = counter_index+1
+        documents = []
+        file_ranges = {}
+        for filename, content in file_texts:
+            first_index = counter_index+1
+            for batch in batched_chunks(split_text(content, 100), first_index, UPSERT_BATCH_SIZE):
+                documents.extend(batch)
+                counter_index = batch[-1][0]
+            file_ranges[filename] = [first_index, counter_index]
+        segment = None
+        if documents:
+            embedding = embedding_models.embeddings(hybrid=True, content=True)
+            try:
+                embedding.index(documents)
+                embedding.save(temp_index_path)
+                segment = add_delta_segment(brainName, temp_index_path, first_segment_index, counter_index)
+            finally:
+                embedding.close()
+                shutil.rmtree(temp_index_path, ignore_errors=True)
+            temp_dict.setdefault('segments', []).append(segment)
+            logging.info(f"For BrainID - {brainName}, Segment {segment['id']} added with {len(documents)} chunks of {len(file_ranges)} files")
+
+        temp_dict['last_index'] = counter_index
+        temp_dict['files'].update(file_ranges)
+        save_file_index_ranges(brainName,temp_dict)
+        bump_index_version(brainName)
+    return segment
 
 
 def create_embeddings(filename,content,source_fold,target_folder,brainName):
@@ -78,7 +166,7 @@ def create_embeddings(filename,content,source_fold,target_folder,brainName):
     Returns:
         None
     """
-    embeddings = Embeddings(hybrid =True,content=True)
+    embeddings = embedding_models.embeddings(hybrid=True, content=True)
 
     word_chunks = split_text(content, 100)
     for i in range(len( word_chunks)):
@@ -103,37 +191,35 @@ def create_embeddings(filename,content,source_fold,target_folder,brainName):
     embeddings.save(target_folder)
 
 
-def delete_embedding_data(start_range,end_range,temp_index_path,brainName):
+def delete_embedding_data(ranges,temp_index_path,brainName):
     """
-    Deletes embedding data within the specified range from the brain.
+    Deletes the embedding data of several id ranges from the brain in one load, delete and save.
     
     Args: 
-        start_range (int): The starting index of the range to delete.
-        end_range (int): The ending index of the range to delete.
+        ranges (list): The [start, end] id ranges to delete, both ends included.
         temp_index_path (str): The path to the temporary index file.
         brainName (str): The name of the brain to update.
     
     Returns:
-        None
+        int: The number of ids actually removed from the index.
+
+    Raises:
+        Exception: If the index could not be loaded, deleted from or saved.
     """
-    embedding = Embeddings(hybrid =True,content=True)
+    embedding = embedding_models.embeddings(hybrid=True, content=True)
     try:
         embedding.load(temp_index_path)
         logging.info(f"For BrainID - {brainName}, Embedding Loaded From {temp_index_path}")
-    except Exception as e:
+    except Exception:
         logging.error(f"For BrainID - {brainName}, Failed To Load Embedding Index To {temp_index_path}")
-        return send_error(data=[str(e)], message= "Failed to Load information in server folder" ,status=500)
-    
-    for i in range(start_range,end_range+1):
-        try:
-            r= embedding.delete([i])
-            if len(r)>0:
-                if int(r[0]) ==i:
-                    logging.info(f"For BrainID - {brainName}, Embedding Deleted For {i} {temp_index_path}")
+        raise
 
-        except Exception as e:
-            logging.error(f"For BrainID - {brainName}, Failed To Delete Index {i} for brain in {temp_index_path} {e}")
+    ids = [i for start_range, end_range in ranges for i in range(start_range, end_range+1)]
+    try:
+        removed = embedding.delete(ids)
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName}, Failed To Delete {len(ids)} Ids for brain in {temp_index_path} {e}")
+        raise
+    logging.info(f"For BrainID - {brainName}, Embedding Deleted For {len(removed)} of {len(ids)} Ids in {len(ranges)} Ranges {temp_index_path}")
     embedding.save(temp_index_path)
-        
-
-    
\ No newline at end of file
+    return len(removed)
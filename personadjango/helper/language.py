@@ -0,0 +1,146 @@
+import os
+import logging
+from threading import Lock
+from collections import OrderedDict
+from dotenv import load_dotenv
+from langdetect import DetectorFactory, detect_langs
+from personadjango.services.openai import (
+                                openai_language_detection,
+                                async_openai_language_detection
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Make langdetect deterministic, it samples the text randomly otherwise
+DetectorFactory.seed = 0
+
+# Questions shorter than this, or detected with a lower probability, go to the LLM
+LANGUAGE_MIN_WORDS = int(os.environ.get('LANGUAGE_MIN_WORDS', 4))
+LANGUAGE_MIN_CONFIDENCE = float(os.environ.get('LANGUAGE_MIN_CONFIDENCE', 0.90))
+LANGUAGE_CACHE_SIZE = int(os.environ.get('LANGUAGE_CACHE_SIZE', 2048))
+
+language_cache = OrderedDict()
+language_cache_lock = Lock()
+
+def normalize_text(text):
+    """
+    Normalize text so that repeated questions share a cache entry.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The lower-cased text with collapsed whitespace.
+    """
+    return " ".join(text.lower().split())
+
+def get_cached_language(text):
+    """
+    Look up a previously detected language code.
+
+    Args:
+        text (str): The normalized text.
+
+    Returns:
+        str: The cached language code, or None if the text was not seen recently.
+    """
+    with language_cache_lock:
+        language = language_cache.get(text)
+        if language is not None:
+            language_cache.move_to_end(text)
+        return language
+
+def cache_language(text, language):
+    """
+    Remember the language code detected for a text, evicting the least recently used entry.
+
+    Args:
+        text (str): The normalized text.
+        language (str): The detected language code.
+    """
+    if not language:
+        return
+    with language_cache_lock:
+        language_cache[text] = language
+        language_cache.move_to_end(text)
+        while len(language_cache) > LANGUAGE_CACHE_SIZE:
+            language_cache.popitem(last=False)
+
+def detect_language_locally(text):
+    """
+    Detect the language of a text with langdetect.
+
+    Args:
+        text (str): The text to analyse.
+
+    Returns:
+        tuple: (str, float) with the most likely language code and its probability,
+               or (None, 0.0) if langdetect could not decide.
+    """
+    try:
+        best = detect_langs(text)[0]
+        return best.lang, best.prob
+    except Exception as e:
+        logging.warning(f"Local language detection failed: {e}")
+        return None, 0.0
+
+def resolve_language_locally(text):
+    """
+    Run the cache and local detection tiers.
+
+    Args:
+        text (str): The text to analyse.
+
+    Returns:
+        tuple: (str, str) with the normalized text and the language code, the code is
+               None when the text is too short or ambiguous and needs the LLM tier.
+    """
+    normalized = normalize_text(text)
+    language = get_cached_language(normalized)
+    if language is not None:
+        logging.info(f"Language '{language}' served from cache")
+        return normalized, language
+
+    if len(normalized.split()) >= LANGUAGE_MIN_WORDS:
+        language, confidence = detect_language_locally(normalized)
+        if language and confidence >= LANGUAGE_MIN_CONFIDENCE:
+            logging.info(f"Language '{language}' detected locally with confidence {confidence:.2f}")
+            cache_language(normalized, language)
+            return normalized, language
+        logging.info(f"Local language detection not confident enough ({language}, {confidence:.2f}), falling back to LLM")
+    else:
+        logging.info("Text too short for local language detection, falling back to LLM")
+    return normalized, None
+
+def detect_question_language(text):
+    """
+    Detect the language code of a question, trying the cache, then langdetect, then the LLM.
+
+    Args:
+        text (str): The question asked by the user.
+
+    Returns:
+        str: The detected language code.
+    """
+    normalized, language = resolve_language_locally(text)
+    if language is None:
+        language = openai_language_detection(text)
+        cache_language(normalized, language)
+    return language
+
+async def async_detect_question_language(text):
+    """
+    Async version of detect_question_language, the LLM tier uses the async OpenAI client.
+
+    Args:
+        text (str): The question asked by the user.
+
+    Returns:
+        str: The detected language code.
+    """
+    normalized, language = resolve_language_locally(text)
+    if language is None:
+        language = await async_openai_language_detection(text)
+        cache_language(normalized, language)
+    return language
@@ -0,0 +1,92 @@
+import re
+import logging
+from threading import Lock
+from personadjango.helper.language import (
+                                resolve_language_locally
+                                )
+
+# Directive verbs the LLM check looks for ("say", "respond with", ...). A question that
+# contains none of them cannot be a manipulation attempt by that definition.
+DIRECTIVE_PATTERN = re.compile(
+    r"\b("
+    r"say|says|said|saying|"
+    r"repeat|respond|reply|answer with|"
+    r"answer (only|just|yes|no|true|false|in one word)|(answer|reply|respond) (only|just|exactly)|"
+    r"(start|begin|end|finish) (your|the|each) (answer|reply|response)|"
+    r"tell (me|us|them|everyone) (that|you)|"
+    r"pretend|act as|roleplay|role-play|"
+    r"ignore|disregard|forget|override|"
+    r"from now on|you must|you have to|you will|you should|"
+    r"write|type|output|print|declare|admit|confess|announce|"
+    r"instructions?|system prompt|prompt"
+    r")\b",
+    re.IGNORECASE
+)
+
+# Phrases that contain a directive word but are casual inquiries, which the LLM check
+# is told not to treat as manipulation
+BENIGN_DIRECTIVE_PATTERN = re.compile(
+    r"\b(what|how) (do|would|did|does|could|can) (you|they|he|she|people|we) (say|respond|reply|answer)\b"
+    r"|\bwhat (did|does|do) (it|the \w+|this|that) say\b",
+    re.IGNORECASE
+)
+
+class ManipulationPrefilter:
+    """
+    Local prefilter that clears obviously benign questions before the openai_analysis check.
+
+    The patterns are English, so only questions detected locally as English can be cleared.
+    Such a question is cleared when it has no directive word at all, or when every directive
+    word is part of a known casual inquiry ("what would you say ..."). Anything else is
+    passed through to the LLM. Counters are kept so the saved calls can be measured.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.cleared = 0
+        self.passed_through = 0
+        self.not_english = 0
+
+    def is_benign(self, text):
+        """
+        Decide locally whether a question is clearly not a manipulation attempt.
+
+        Args:
+            text (str): The question asked by the user.
+
+        Returns:
+            bool: True if the question can skip the LLM check, False if it needs it.
+        """
+        # Short or ambiguous questions have no local language and go to the LLM as well
+        _, language = resolve_language_locally(text)
+        english = language == 'en'
+        benign = english and DIRECTIVE_PATTERN.search(BENIGN_DIRECTIVE_PATTERN.sub(" ", text)) is None
+        with self.lock:
+            if benign:
+                self.cleared += 1
+            else:
+                self.passed_through += 1
+            if not english:
+                self.not_english += 1
+            cleared, total = self.cleared, self.cleared + self.passed_through
+        logging.info(f"Manipulation prefilter {'cleared' if benign else 'passed through'} question, cleared {cleared}/{total} ({cleared / total:.1%}) so far")
+        return benign
+
+    def stats(self):
+        """
+        Report how many questions were cleared locally and how many went to the LLM.
+
+        Returns:
+            dict: Counts and rates of cleared and passed through questions.
+        """
+        with self.lock:
+            total = self.cleared + self.passed_through
+            return {
+                'total': total,
+                'cleared': self.cleared,
+                'passed_through': self.passed_through,
+                'not_english': self.not_english,
+                'hit_rate': (self.cleared / total) if total else 0.0,
+                'pass_through_rate': (self.passed_through / total) if total else 0.0,
+            }
+
+manipulation_prefilter = ManipulationPrefilter()
@@ -0,0 +1,144 @@
+import os
+import logging
+from collections import Counter
+from dotenv import load_dotenv
+from nltk.tokenize import sent_tokenize, word_tokenize
+from personadjango.services.openai import (
+                                summarize_previous_qa,
+                                async_summarize_previous_qa
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# The previous turn is condensed locally unless the LLM summary is opted into
+SUMMARY_LLM_ENABLED = os.environ.get('CHAT_LLM_SUMMARY', 'False').lower() in ['true']
+# Same size as the 30-40 words the LLM summary is asked for
+SUMMARY_WORD_BUDGET = int(os.environ.get('SUMMARY_WORD_BUDGET', 40))
+
+# Words that carry no topic, they are ignored when scoring sentences
+STOP_WORDS = frozenset("""
+    a about above after again against all am an and any are as at be because been before being
+    below between both but by can could did do does doing down during each few for from further
+    had has have having he her here hers herself him himself his how i if in into is it its itself
+    just me more most my myself no nor not now of off on once only or other our ours ourselves out
+    over own same she should so some such than that the their theirs them themselves then there
+    these they this those through to too under until up very was we were what when where which
+    while who whom why will with would you your yours yourself yourselves
+""".split())
+
+def content_words(text):
+    """
+    Split a text into lower-cased words, without punctuation and stop words.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The content words of the text, in order.
+    """
+    return [word.lower() for word in word_tokenize(text) if word.isalnum() and word.lower() not in STOP_WORDS]
+
+def truncate_words(text, limit):
+    """
+    Keep at most limit words of a text.
+
+    Args:
+        text (str): The text to truncate.
+        limit (int): The maximum number of words.
+
+    Returns:
+        str: The first limit words of the text.
+    """
+    return " ".join(text.split()[:max(limit, 0)])
+
+def condense_previous_qa(previous_question, previous_answer, word_budget=SUMMARY_WORD_BUDGET):
+    """
+    Condense the previous question and answer into at most word_budget words, without an LLM call.
+
+    The previous question is kept (up to half the budget). The rest of the budget goes to the
+    answer sentences with the highest average word frequency, with a bonus for words shared with
+    the question, and the picked sentences are kept in their original order.
+
+    Args:
+        previous_question (str): The previous user question.
+        previous_answer (str): The previous answer provided.
+        word_budget (int, optional): The maximum number of words of the condensed text.
+
+    Returns:
+        str: The condensed previous turn followed by a space, or an empty string if there is none.
+    """
+    question = truncate_words(previous_question or "", word_budget // 2)
+    remaining = word_budget - len(question.split())
+
+    answer = ""
+    sentences = sent_tokenize(previous_answer or "")
+    if sentences and remaining > 0:
+        frequencies = Counter(content_words(previous_answer))
+        top_frequency = max(frequencies.values(), default=1)
+        question_words = set(content_words(previous_question or ""))
+
+        scored = []
+        for index, sentence in enumerate(sentences):
+            words = content_words(sentence)
+            if not words:
+                continue
+            score = sum(frequencies[word] / top_frequency + (1 if word in question_words else 0) for word in words) / len(words)
+            scored.append((score, index, sentence))
+
+        selected = []
+        for score, index, sentence in sorted(scored, key=lambda item: (-item[0], item[1])):
+            length = len(sentence.split())
+            if length <= remaining:
+                selected.append((index, sentence))
+                remaining -= length
+            elif not selected:
+                # Not even the best sentence fits, keep its beginning
+                selected.append((index, truncate_words(sentence, remaining)))
+                remaining = 0
+            if remaining <= 0:
+                break
+        answer = " ".join(sentence for _, sentence in sorted(selected))
+
+    condensed = " ".join(part for part in (question, answer) if part)
+    return f"{condensed} " if condensed else ""
+
+def condense_previous_qa_safely(previous_question, previous_answer):
+    """
+    Run condense_previous_qa, falling back to plain truncation if the NLTK tokenizers fail.
+    """
+    try:
+        return condense_previous_qa(previous_question, previous_answer)
+    except Exception as e:
+        logging.warning(f"Local summary failed, truncating previous turn instead: {e}")
+        condensed = truncate_words(f"{previous_question or ''} {previous_answer or ''}", SUMMARY_WORD_BUDGET)
+        return f"{condensed} " if condensed else ""
+
+def summarize_previous_turn(previous_question, previous_answer):
+    """
+    Summarize the previous question and answer for the search query and the prompt.
+
+    Condensed locally by default, by summarize_previous_qa when CHAT_LLM_SUMMARY is set.
+
+    Args:
+        previous_question (str): The previous user question.
+        previous_answer (str): The previous answer provided.
+
+    Returns:
+        str: The summary, empty when there is no previous question.
+    """
+    if not previous_question:
+        return ""
+    if SUMMARY_LLM_ENABLED:
+        return summarize_previous_qa(previous_question, previous_answer)
+    return condense_previous_qa_safely(previous_question, previous_answer)
+
+async def async_summarize_previous_turn(previous_question, previous_answer):
+    """
+    Async version of summarize_previous_turn, the LLM summary uses the async OpenAI client.
+    """
+    if not previous_question:
+        return ""
+    if SUMMARY_LLM_ENABLED:
+        return await async_summarize_previous_qa(previous_question, previous_answer)
+    return condense_previous_qa_safely(previous_question, previous_answer)
@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+from django.core.files.storage import FileSystemStorage
+from openai import OpenAI
+from dotenv import load_dotenv
+from personadjango.services.s3 import (
+    download_files_from_s3,
+    upload_folder_to_s3,
+    check_content_in_s3_folder,
+    upload_file_to_s3,
+    upload_content_from_fileindexrange_to_s3,
+)
+from personadjango.services.index import (
+    delete_folder_content,
+    read_file_index_ranges,
+    bump_index_version,
+)
+from personadjango.services.openai import (
+    whisper_transcription
+)
+from personadjango.services.answer_cache import invalidate_cached_answers
+from personadjango.embeddings import (
+    append_files_to_brain,
+    append_segment_to_brain
+)
+from personadjango.services.segments import (
+    SEGMENTED_INDEX,
+    schedule_compaction
+)
+from personadjango.helper.text_extract import (
+    load_all_text,
+)
+from personadjango.helper.transcriptions import (
+    convert_video_to_audio,
+    save_transcription_to_file
+)
+
+load_dotenv()
+
+# Status reported for a file that was indexed, any other status is an error
+FILE_PROCESSED = 'File uploaded and processed successfully'
+
+def ingest_files(brainName, files, progress=None):
+    """
+    Extract, index and upload files to an existing brain.
+
+    Every file is extracted first, then the brain index is downloaded, appended to, saved
+    and uploaded once for all of them, as is the brain metadata.
+
+    Args:
+        brainName (str): The name of the brain, it must exist in S3.
+        files (list): The uploaded files, objects with a name that FileSystemStorage can save.
+        progress (callable, optional): Called with (position, filename, status, seconds) when
+                                       the file at that position of files is done, status is
+                                       FILE_PROCESSED or the reason it was not indexed. A failed
+                                       extraction is reported at once, the indexed files after
+                                       the index upload, with an even share of its time.
+
+    Returns:
+        list: The status of every file, in the order of files, as returned by the upload API.
+    """
+    # Decided before the files are uploaded, they make the brain look like it has content
+    has_content = check_content_in_s3_folder(brainName)
+    existing_files = set(read_file_index_ranges(brainName).get('files', {}))
+    statuses = [None] * len(files)
+    extracted = []
+
+    for position, file in enumerate(files):
+        start_time = time.perf_counter()
+        filename, text, error = extract_file(brainName, file, existing_files)
+        seconds = time.perf_counter() - start_time
+        if error is not None:
+            statuses[position] = {'filename': filename, 'status': error}
+            if progress is not None:
+                progress(position, file.name, error, seconds)
+            continue
+        # A second file of the same name in this upload is a duplicate too
+        existing_files.add(filename)
+        extracted.append((position, filename, text, seconds))
+
+    if not extracted:
+        return statuses
+
+    start_time = time.perf_counter()
+    error = index_files(brainName, [(filename, text) for _, filename, text, _ in extracted], has_content)
+    share = (time.perf_counter() - start_time) / len(extracted)
+    status = FILE_PROCESSED if error is None else error
+    for position, filename, _, seconds in extracted:
+        statuses[position] = {'filename': filename, 'status': status}
+        if progress is not None:
+            progress(position, files[position].name, status, seconds + share)
+
+    # Nothing changed when the index update failed, the cached answers are still valid
+    if error is None:
+        if SEGMENTED_INDEX:
+            schedule_compaction(brainName)
+        # Answers generated before the upload may miss the new content
+        invalidate_cached_answers(brainName)
+    return statuses
+
+def extract_file(brainName, file, existing_files):
+    """
+    Extract the text of one uploaded file and upload the file to the brain's content in S3.
+
+    Audio and video files are transcribed, the transcription replaces them.
+
+    Args:
+        brainName (str): The name of the brain.
+        file (UploadedFile): The file to extract.
+        existing_files (set): The names of the files the brain already has.
+
+    Returns:
+        tuple: (str filename, str text, str error), error is None if the text can be indexed.
+    """
+    filename = file.name
+    if not filename:
+        logging.error(f'For BrainID - {brainName}, File Content Is None')
+        return filename, None, 'No selected file'
+    if not filename.endswith((".txt", ".pdf", ".docx", ".mp3", ".wav", ".ogg", ".mov", ".mp4", ".mkv")):
+        logging.error(f'Unsupported File Format for {filename}')
+        return filename, None, 'Unsupported file format'
+
+    temp_folder_path = f"{os.environ.get('TEMP_FILE_STORAGE')}/{brainName}/"
+    if not os.path.exists(temp_folder_path):
+        os.makedirs(temp_folder_path)
+        logging.info('Temporary folder created')
+    fs = FileSystemStorage(location=temp_folder_path)
+
+    # Handle audio and video files
+    if filename.endswith((".mp3", ".wav", ".ogg", ".mov", ".mp4", ".mkv")):
+        fs.save(filename, file)
+
+        # Process the audio or video file
+        audio_file_path = f"{temp_folder_path}/{filename}"
+        if filename.endswith((".mov", ".mp4", ".mkv")):
+            video_file_path = f"{temp_folder_path}/{filename}"
+            audio_file_path = f"{temp_folder_path}/{filename}.mp3"
+            convert_video_to_audio(video_file_path, audio_file_path)
+
+        # Transcribe the audio file
+        try:
+            client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY_1'))
+            extracted_text = whisper_transcription(audio_file_path, client)
+            logging.info('Transcription generated')
+            os.remove(audio_file_path)
+        except Exception as e:
+            logging.error(f'Error transcribing audio: {e}')
+            os.remove(audio_file_path)
+            return filename, None, 'Error transcribing audio'
+
+        # Save the transcription to a text file, it is indexed in place of the upload
+        text_file_path = f"{temp_folder_path}/{os.path.splitext(filename)[0]}.txt"
+        save_transcription_to_file(extracted_text, text_file_path)
+        logging.info(f'Transcription saved to {text_file_path}')
+        filename = os.path.basename(text_file_path)
+    else:
+        fs.save(filename, file)
+
+    try:
+        if filename in existing_files:
+            return filename, None, 'File already exists'
+
+        text, flag = load_all_text(temp_folder_path)
+        logging.info(f'Flag is - {flag}')
+        if flag:
+            return filename, None, text
+
+        for x in os.listdir(temp_folder_path):
+            try:
+                upload_file_to_s3(f'{temp_folder_path}/{x}', os.environ.get('BUCKET_NAME'), brainName, x)
+            except Exception as e:
+                logging.error(f'Error uploading file to S3: {e}')
+                return filename, None, str(e)
+        return filename, text, None
+    finally:
+        # The folder is read as a whole, it only ever holds the file being extracted
+        delete_folder_content(temp_folder_path)
+
+def index_files(brainName, file_texts, has_content):
+    """
+    Add the text of several files to the brain index in one download, append, save and upload.
+
+    Args:
+        brainName (str): The name of the brain.
+        file_texts (list): (filename, content) pairs of the files to add.
+        has_content (bool): False to build a new index for a brain without content.
+
+    Returns:
+        str: None if the files were indexed, otherwise the reason they were not.
+    """
+    # Segmented brains get one delta segment for all the files, their index is not downloaded
+    if has_content and SEGMENTED_INDEX:
+        try:
+            append_segment_to_brain(file_texts, f"{os.environ.get('TEMP_INDEX_STORAGE')}/{brainName}-segment", brainName)
+            logging.info(f'{len(file_texts)} files added as index segment')
+            upload_content_from_fileindexrange_to_s3(brainName)
+        except Exception as e:
+            logging.error(f'Error adding index segment for {len(file_texts)} files: {str(e)}')
+            return 'Error processing file'
+        return None
+
+    temp_index_path = f"{os.environ.get('TEMP_INDEX_STORAGE')}/{brainName}"
+    if not os.path.exists(temp_index_path):
+        os.makedirs(temp_index_path)
+        logging.info('Temporary index folder created')
+
+    try:
+        if has_content:
+            try:
+                download_files_from_s3(os.environ.get('BUCKET_NAME'), f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}", temp_index_path)
+                logging.info(f"For BrainID - {brainName}, Index File Content Downloaded From S3 Bucket to {temp_index_path}")
+            except Exception as e:
+                logging.error(f"For BrainID - {brainName}, Failed To Download Index To {temp_index_path} from S3 Bucket - {os.environ.get('BUCKET_NAME')}")
+                return f"For BrainID - {brainName}, Failed To Download Index To {temp_index_path} from S3 Bucket - {os.environ.get('BUCKET_NAME')}"
+
+        try:
+            append_files_to_brain(file_texts, temp_index_path, brainName, create=not has_content)
+            logging.info(f'For BrainID- {brainName}, Index updated with {len(file_texts)} files at {temp_index_path}')
+        except Exception as e:
+            logging.error(f'Error processing {len(file_texts)} files: {str(e)}')
+            return 'Error processing file'
+
+        try:
+            upload_folder_to_s3(os.environ.get('BUCKET_NAME'), temp_index_path, f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}")
+            logging.info(f'Index uploaded for brain {brainName}')
+            # Workers serving the brain reload it when they see the new version
+            bump_index_version(brainName)
+        except Exception as e:
+            logging.error(f'Index upload failed for brain {brainName}: {str(e)}')
+            return f'Index upload failed for brain {brainName}: {str(e)}'
+    finally:
+        delete_folder_content(temp_index_path)
+        upload_content_from_fileindexrange_to_s3(brainName)
+    return None
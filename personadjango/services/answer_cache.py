@@ -0,0 +1,229 @@
+import os
+import time
+import logging
+import numpy as np
+from threading import Lock
+from collections import OrderedDict
+from dotenv import load_dotenv
+from personadjango.services.brains import embed_text
+from personadjango.services.index_versions import (
+                                metadata_version,
+                                read_current_metadata,
+                                remote_metadata
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'True').lower() in ['true']
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', 1024))
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', 3600))
+# Cosine similarity above which a cached question counts as a near duplicate, 0 disables the match
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', 0))
+
+def normalize_question(question):
+    """
+    Normalize a question so that trivially different spellings share a cache entry.
+
+    Args:
+        question (str): The question asked by the user.
+
+    Returns:
+        str: The lower-cased question with collapsed whitespace and no trailing punctuation.
+    """
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+class AnswerCache:
+    """
+    Per-brain cache of generated answers with LRU and TTL eviction.
+
+    Entries are keyed on brain, index version, answering mode, normalized question, language,
+    word limit and toxic filter. The index version comes from the brain metadata every worker
+    follows, so an answer is no longer served anywhere once a newer index is visible. The mode
+    keeps the endpoints apart, their prompts and guards differ, so an answer is only served by
+    the kind of request that generated it.
+    When a similarity threshold is set, a miss falls back to the closest cached question
+    of the same brain and mode, compared with the brain's own embedding model.
+
+    Args:
+        max_entries (int): Maximum number of answers kept across all brains.
+        ttl (int): Seconds an answer stays valid.
+        similarity_threshold (float): Minimum cosine similarity for a near-duplicate hit, 0 disables it.
+    """
+    def __init__(self, max_entries, ttl, similarity_threshold):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.lock = Lock()
+
+    def question_vector(self, brainName, question):
+        """
+        Encode a question for the near-duplicate match, None when the match is disabled or the brain is not loaded.
+        """
+        if self.similarity_threshold <= 0:
+            return None
+        try:
+            vector = embed_text(brainName, question)
+        except Exception as e:
+            logging.warning(f"For BrainID - {brainName}, Failed to embed question for answer cache: {e}")
+            return None
+        if vector is None:
+            return None
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, brainName, index_version, mode, question, language, word_limit, toxic_filter):
+        """
+        Look up a cached answer.
+
+        Args:
+            brainName (str): The name of the brain.
+            index_version (int): The brain's current index version.
+            mode (str): The endpoint and answering mode of the request, e.g. 'chat' or 'chatbot'.
+            question (str): The question asked by the user.
+            language (str): The language code of the question.
+            word_limit (int): The requested response size.
+            toxic_filter (bool): Whether the toxic filter was requested.
+
+        Returns:
+            dict: The cached payload, or None on a miss.
+        """
+        key = (brainName, index_version, mode, normalize_question(question), language, word_limit, toxic_filter)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry['expires_at'] > now:
+                    self.entries.move_to_end(key)
+                    logging.info(f"For BrainID - {brainName}, Answer served from cache")
+                    return entry['payload']
+                del self.entries[key]
+
+        vector = self.question_vector(brainName, question)
+        if vector is None:
+            return None
+        best_entry, best_score = None, self.similarity_threshold
+        with self.lock:
+            for other_key, other in self.entries.items():
+                if other_key[:3] != key[:3] or other_key[4:] != key[4:] or other['vector'] is None or other['expires_at'] <= now:
+                    continue
+                score = float(np.dot(vector, other['vector']))
+                if score >= best_score:
+                    best_entry, best_score = other, score
+        if best_entry is not None:
+            logging.info(f"For BrainID - {brainName}, Answer served from cache by near-duplicate match ({best_score:.3f})")
+            return best_entry['payload']
+        return None
+
+    def generation(self, brainName):
+        """
+        Return the brain's invalidation counter, captured before an answer is generated.
+
+        Args:
+            brainName (str): The name of the brain.
+
+        Returns:
+            int: The number of times the brain's answers were invalidated.
+        """
+        with self.lock:
+            return self.generations.get(brainName, 0)
+
+    def put(self, brainName, index_version, mode, question, language, word_limit, toxic_filter, payload, generation):
+        """
+        Store a generated answer, unless the brain changed while it was being generated.
+
+        Args:
+            brainName (str): The name of the brain.
+            index_version (int): The brain's index version when the request started.
+            mode (str): The endpoint and answering mode of the request.
+            question (str): The question asked by the user.
+            language (str): The language code of the question.
+            word_limit (int): The requested response size.
+            toxic_filter (bool): Whether the toxic filter was requested.
+            payload (dict): The payload returned to the client.
+            generation (int): The value of generation(brainName) when the request started.
+        """
+        key = (brainName, index_version, mode, normalize_question(question), language, word_limit, toxic_filter)
+        vector = self.question_vector(brainName, question)
+        with self.lock:
+            if self.generations.get(brainName, 0) != generation:
+                logging.info(f"For BrainID - {brainName}, Brain changed during the request, answer not cached")
+                return
+            self.entries[key] = {'payload': payload, 'expires_at': time.time() + self.ttl, 'vector': vector}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, brainName):
+        """
+        Drop every cached answer of a brain, after its content changed.
+
+        Args:
+            brainName (str): The name of the brain.
+        """
+        with self.lock:
+            self.generations[brainName] = self.generations.get(brainName, 0) + 1
+            for key in [key for key in self.entries if key[0] == brainName]:
+                del self.entries[key]
+        logging.info(f"For BrainID - {brainName}, Answer cache invalidated")
+
+answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+
+def get_answer_cache_version(brainName):
+    """
+    Return the index version a brain's answers are cached under.
+
+    Read from the brain metadata, which follows the version uploaded to S3 by other nodes
+    within INDEX_VERSION_CHECK_TTL, so uploads, deletions and renames on another worker
+    stop the cached answers of the old index here too.
+
+    Args:
+        brainName (str): The name of the brain.
+
+    Returns:
+        int: The index version, or None if the brain has no metadata or S3 no longer has it,
+             in which case nothing is served from or stored in the cache.
+    """
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    try:
+        metadata, _ = read_current_metadata(brainName)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logging.warning(f"For BrainID - {brainName}, Failed to read index version for answer cache: {e}")
+        return None
+    if remote_metadata.missing(brainName):
+        return None
+    return metadata_version(metadata)
+
+def get_cached_answer(brainName, index_version, mode, question, language, word_limit, toxic_filter):
+    """
+    Look up a cached answer if the answer cache is enabled, see AnswerCache.get.
+    """
+    if not ANSWER_CACHE_ENABLED or not language or index_version is None:
+        return None
+    return answer_cache.get(brainName, index_version, mode, question, language, word_limit, toxic_filter)
+
+def get_answer_cache_generation(brainName):
+    """
+    Return the brain's answer cache invalidation counter, see AnswerCache.generation.
+    """
+    return answer_cache.generation(brainName)
+
+def cache_answer(brainName, index_version, mode, question, language, word_limit, toxic_filter, payload, generation):
+    """
+    Store an answer if the answer cache is enabled, see AnswerCache.put.
+    """
+    if not ANSWER_CACHE_ENABLED or not language or index_version is None:
+        return
+    answer_cache.put(brainName, index_version, mode, question, language, word_limit, toxic_filter, payload, generation)
+
+def invalidate_cached_answers(brainName):
+    """
+    Drop every cached answer of a brain, see AnswerCache.invalidate.
+    """
+    answer_cache.invalidate(brainName)
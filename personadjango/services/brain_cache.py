@@ -0,0 +1,344 @@
+import os
+import time
+import logging
+from threading import Lock
+from contextlib import contextmanager
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Approximate memory the loaded brain indexes may use together, and how long an unused brain stays loaded
+BRAIN_CACHE_MAX_BYTES = int(os.environ.get('BRAIN_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+BRAIN_CACHE_IDLE_TTL = int(os.environ.get('BRAIN_CACHE_IDLE_TTL', 3600))
+
+def folder_size(path):
+    """
+    Sum the size of the files in a folder.
+
+    Args:
+        path (str): The folder to measure.
+
+    Returns:
+        int: The total size in bytes, 0 if the folder does not exist.
+    """
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def estimate_index_bytes(embeddings, index_path, mapped_file=None):
+    """
+    Estimate the memory a loaded txtai index uses.
+
+    The saved index files (vectors, documents and keyword scoring) are a close lower bound
+    of what load() keeps in memory. When they cannot be measured the raw vector size is used.
+
+    Args:
+        embeddings (Embeddings): The loaded txtai index.
+        index_path (str): The folder the index was loaded from, before it is cleaned up.
+        mapped_file (str, optional): A file of the folder that was memory-mapped instead of read,
+                                     the page cache holds it rather than the process.
+
+    Returns:
+        int: The estimated size in bytes.
+    """
+    size = folder_size(index_path)
+    if size and mapped_file:
+        try:
+            size -= os.path.getsize(os.path.join(index_path, mapped_file))
+        except OSError:
+            pass
+    if size:
+        return size
+    try:
+        dimensions = (embeddings.config or {}).get('dimensions') or 0
+        return embeddings.count() * dimensions * 4
+    except Exception as e:
+        logging.warning(f"Failed to estimate index size: {e}")
+        return 0
+
+class BrainCache:
+    """
+    Loaded brain indexes with a memory budget, LRU and idle-TTL eviction.
+
+    Searches pin the entry they use. Replacing or evicting a brain only swaps the entry
+    out of the cache, under the cache lock, so new searches never wait. The old index is
+    closed once the searches that pinned it are done.
+
+    Args:
+        max_bytes (int): Budget for the estimated size of all loaded brains.
+        idle_ttl (int): Seconds a brain stays loaded without being used, 0 keeps it until evicted by size.
+    """
+    def __init__(self, max_bytes, idle_ttl):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.draining = 0
+
+    def contains(self, brainName):
+        """
+        Check whether a brain is loaded, without counting it as a use.
+        """
+        with self.lock:
+            return brainName in self.entries
+
+    def loaded_version(self, brainName):
+        """
+        Return the index version stamp of a loaded brain, without counting it as a use.
+
+        Returns:
+            int: The version the loaded index was built from, None if the brain is not loaded.
+        """
+        with self.lock:
+            entry = self.entries.get(brainName)
+            return None if entry is None else entry['version']
+
+    @contextmanager
+    def use(self, brainName):
+        """
+        Pin the loaded index of a brain for the duration of a search and mark it as recently used.
+
+        Args:
+            brainName (str): The name of the brain.
+
+        Yields:
+            dict: The brain entry with its 'embeddings', 'personality_name', 'files' and
+                  usage fields, or None if the brain is not loaded.
+        """
+        with self.lock:
+            entry = self.entries.get(brainName)
+            if entry is not None:
+                entry['searches'] += 1
+                entry['last_access'] = time.time()
+                entry['hits'] += 1
+                self.entries.move_to_end(brainName)
+        try:
+            yield entry
+        finally:
+            if entry is not None:
+                with self.lock:
+                    entry['searches'] -= 1
+                    released = entry['retired'] and entry['searches'] == 0
+                    if released:
+                        self.draining -= 1
+                if released:
+                    self.release(brainName, entry)
+
+    def retire(self, entry):
+        """
+        Mark an entry swapped out of the cache. Called with self.lock held.
+
+        Returns:
+            bool: True if no search holds the entry and it can be released right away.
+        """
+        entry['retired'] = True
+        if entry['searches']:
+            self.draining += 1
+            return False
+        return True
+
+    def release(self, brainName, entry):
+        """
+        Close a retired index, once no search uses it anymore.
+        """
+        try:
+            entry['embeddings'].close()
+        except Exception as e:
+            logging.warning(f"For BrainID - {brainName}, Failed to close index version {entry['version']}: {e}")
+        logging.info(f"For BrainID - {brainName}, Index version {entry['version']} released from memory")
+
+    def put(self, brainName, embeddings, personality_name, files, size, version=0, load_seconds=0.0):
+        """
+        Store a loaded brain, then evict least recently used brains until the budget is met.
+
+        A brain that is already loaded is replaced in one step: searches started before keep
+        the old index until they finish, searches started after use the new one.
+
+        Args:
+            brainName (str): The name of the brain.
+            embeddings (Embeddings): The loaded txtai index.
+            personality_name (str): The personality name of the brain.
+            files (FileRanges): The file index ranges of the brain.
+            size (int): The estimated size of the index in bytes.
+            version (int, optional): The index version stamp of the brain's metadata.
+            load_seconds (float, optional): How long downloading and loading the index took.
+        """
+        try:
+            vectors = embeddings.count()
+        except Exception as e:
+            logging.warning(f"For BrainID - {brainName}, Failed to count index vectors: {e}")
+            vectors = None
+        now = time.time()
+        entry = {
+            'embeddings': embeddings,
+            'personality_name': personality_name,
+            'files': files,
+            'bytes': size,
+            'version': version,
+            'vectors': vectors,
+            'load_seconds': load_seconds,
+            'loaded_at': now,
+            'last_access': now,
+            'hits': 0,
+            'load_waits': 0,
+            'load_wait_seconds': 0.0,
+            'searches': 0,
+            'retired': False,
+        }
+        with self.lock:
+            previous = self.entries.get(brainName)
+            self.entries[brainName] = entry
+            self.entries.move_to_end(brainName)
+            release_previous = previous is not None and self.retire(previous)
+        if previous is None:
+            logging.info(f"For BrainID - {brainName}, Index version {version} Loaded In RunTime - {embeddings} ({size} bytes)")
+        else:
+            logging.info(f"For BrainID - {brainName}, Index version {previous['version']} swapped for version {version} ({size} bytes)")
+        if release_previous:
+            self.release(brainName, previous)
+        self.evict_to_budget(keep=brainName)
+
+    def pop(self, brainName):
+        """
+        Remove a brain, its index is closed once its in-flight searches are done.
+
+        Args:
+            brainName (str): The name of the brain.
+
+        Returns:
+            bool: True if the brain was loaded, False otherwise.
+        """
+        with self.lock:
+            entry = self.entries.pop(brainName, None)
+            release_now = entry is not None and self.retire(entry)
+        if release_now:
+            self.release(brainName, entry)
+        return entry is not None
+
+    def clear(self):
+        """
+        Remove every loaded brain.
+
+        Returns:
+            bool: True if at least one brain was loaded, False otherwise.
+        """
+        removed = False
+        for brainName in self.names():
+            removed = self.pop(brainName) or removed
+        return removed
+
+    def record_wait(self, brainName, seconds):
+        """
+        Add the time a request waited for a brain to be loaded to the brain's stats.
+
+        Args:
+            brainName (str): The name of the brain.
+            seconds (float): How long the request waited.
+        """
+        with self.lock:
+            entry = self.entries.get(brainName)
+            if entry is not None:
+                entry['load_waits'] += 1
+                entry['load_wait_seconds'] += seconds
+
+    def names(self):
+        """
+        Return the loaded brain names, least recently used first.
+        """
+        with self.lock:
+            return list(self.entries)
+
+    def total_bytes(self):
+        """
+        Return the estimated size of all loaded brains in bytes.
+        """
+        with self.lock:
+            return sum(entry['bytes'] for entry in self.entries.values())
+
+    def evict_to_budget(self, keep=None):
+        """
+        Evict least recently used brains while the loaded brains exceed the byte budget.
+
+        Args:
+            keep (str, optional): A brain that must stay loaded, the one just stored.
+        """
+        while True:
+            with self.lock:
+                total = sum(entry['bytes'] for entry in self.entries.values())
+                victims = [name for name in self.entries if name != keep]
+            if total <= self.max_bytes or not victims:
+                return
+            if self.pop(victims[0]):
+                logging.info(f"For BrainID - {victims[0]}, Evicted from memory to stay within {self.max_bytes} bytes")
+
+    def evict_idle(self):
+        """
+        Evict brains that have not been used for longer than the idle TTL.
+        """
+        if self.idle_ttl <= 0:
+            return
+        deadline = time.time() - self.idle_ttl
+        evicted = []
+        with self.lock:
+            for brainName, entry in list(self.entries.items()):
+                if entry['last_access'] < deadline:
+                    del self.entries[brainName]
+                    evicted.append((brainName, entry, self.retire(entry)))
+        for brainName, entry, release_now in evicted:
+            if release_now:
+                self.release(brainName, entry)
+            logging.info(f"For BrainID - {brainName}, Evicted from memory after {self.idle_ttl} seconds idle")
+
+    def stats(self):
+        """
+        Report the memory use and usage of every loaded brain, for capacity planning.
+
+        Returns:
+            dict: 'brains' with each brain's estimated bytes, vector and file counts, index
+                  version, load time, last access, hits, searches running and time requests
+                  waited for its load, and 'totals' for the whole process.
+        """
+        now = time.time()
+        with self.lock:
+            brains = {
+                brainName: {
+                    'personality_name': entry['personality_name'],
+                    'bytes': entry['bytes'],
+                    'vectors': entry['vectors'],
+                    'files': len(entry['files']),
+                    'version': entry['version'],
+                    'load_seconds': entry['load_seconds'],
+                    'loaded_at': entry['loaded_at'],
+                    'last_access': entry['last_access'],
+                    'idle_seconds': now - entry['last_access'],
+                    'hits': entry['hits'],
+                    'searches': entry['searches'],
+                    'load_waits': entry['load_waits'],
+                    'load_wait_seconds': entry['load_wait_seconds'],
+                }
+                for brainName, entry in self.entries.items()
+            }
+            draining = self.draining
+        return {
+            'brains': brains,
+            'totals': {
+                'brains': len(brains),
+                'bytes': sum(brain['bytes'] for brain in brains.values()),
+                'max_bytes': self.max_bytes,
+                'idle_ttl': self.idle_ttl,
+                'vectors': sum(brain['vectors'] or 0 for brain in brains.values()),
+                'hits': sum(brain['hits'] for brain in brains.values()),
+                'searches': sum(brain['searches'] for brain in brains.values()),
+                'draining': draining,
+                'load_wait_seconds': sum(brain['load_wait_seconds'] for brain in brains.values()),
+            },
+        }
+
+brain_cache = BrainCache(BRAIN_CACHE_MAX_BYTES, BRAIN_CACHE_IDLE_TTL)
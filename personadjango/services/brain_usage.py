@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import logging
+from threading import Lock
+from dotenv import load_dotenv
+from personadjango.services.parallel import (
+                                file_lock
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Per-brain request counts, shared by the worker processes through a JSON file
+BRAIN_USAGE_FILE = os.environ.get('BRAIN_USAGE_FILE', 'brain_usage.json')
+BRAIN_USAGE_FLUSH_INTERVAL = int(os.environ.get('BRAIN_USAGE_FLUSH_INTERVAL', 60))
+
+class BrainUsageHistory:
+    """
+    Counts the requests per brain and merges them into a JSON file now and then, so the
+    most used brains can be prewarmed after a restart. The merge holds a lock on
+    '<path>.lock', so concurrent worker processes do not overwrite each other's counts.
+
+    Args:
+        path (str): The JSON file holding {brainName: {'count': int, 'last_used': float}}.
+        flush_interval (int): Minimum seconds between two writes of the file.
+    """
+    def __init__(self, path, flush_interval):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.last_flush = time.time()
+        self.lock = Lock()
+        self.flush_lock = Lock()
+
+    def record(self, brainName):
+        """
+        Count a request for a brain, writing the counts out when the flush interval passed.
+
+        Args:
+            brainName (str): The name of the brain.
+        """
+        with self.lock:
+            entry = self.pending.setdefault(brainName, {'count': 0, 'last_used': 0.0})
+            entry['count'] += 1
+            entry['last_used'] = time.time()
+            due = time.time() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def read(self):
+        """
+        Read the counts written so far.
+
+        Returns:
+            dict: {brainName: {'count': int, 'last_used': float}}, empty if there is no history yet.
+        """
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"Failed to read brain usage history {self.path}: {e}")
+            return {}
+
+    def flush(self):
+        """
+        Merge the counts of this process into the history file.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.time()
+        if not pending:
+            return
+        try:
+            with self.flush_lock, file_lock(f"{self.path}.lock"):
+                history = self.read()
+                for brainName, entry in pending.items():
+                    saved = history.setdefault(brainName, {'count': 0, 'last_used': 0.0})
+                    saved['count'] += entry['count']
+                    saved['last_used'] = max(saved['last_used'], entry['last_used'])
+                # Written aside and renamed, so readers never see a partial file
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp_path, 'w') as file:
+                    json.dump(history, file)
+                os.replace(temp_path, self.path)
+        except Exception as e:
+            logging.warning(f"Failed to write brain usage history {self.path}: {e}")
+
+    def most_used(self, limit, max_age):
+        """
+        Return the brains with the most requests among those used recently.
+
+        Args:
+            limit (int): The number of brains to return.
+            max_age (int): Only brains used within this many seconds are considered.
+
+        Returns:
+            list: The brain names, most used first.
+        """
+        deadline = time.time() - max_age
+        history = self.read()
+        recent = [(entry['count'], brainName) for brainName, entry in history.items() if entry.get('last_used', 0) >= deadline]
+        return [brainName for _, brainName in sorted(recent, reverse=True)[:limit]]
+
+brain_usage = BrainUsageHistory(BRAIN_USAGE_FILE, BRAIN_USAGE_FLUSH_INTERVAL)
@@ -0,0 +1,331 @@
+import os
+import time
+import logging
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from personadjango.services.s3 import (
+                                download_files_from_s3
+                                )
+from personadjango.services.openai import (
+                                send_error
+                                )
+from personadjango.services.index import (
+                                delete_folder_content,
+                                metadata_cache
+                                )
+from personadjango.services.index_versions import (
+                                metadata_version,
+                                read_current_metadata,
+                                remote_metadata
+                                )
+from personadjango.services.parallel import (
+                                SingleFlight,
+                                run_timed_stage
+                                )
+from personadjango.services.index_cache import (
+                                INDEX_DISK_CACHE_ENABLED,
+                                index_disk_cache
+                                )
+from personadjango.services.embedding_models import (
+                                ANN_FILE_NAME,
+                                BRAIN_LAZY_LOAD,
+                                embedding_models,
+                                mapped_load_config
+                                )
+from personadjango.services.segments import (
+                                SEGMENTED_INDEX,
+                                SegmentedIndex,
+                                load_segments,
+                                pending_compactions,
+                                pending_compactions_lock
+                                )
+from personadjango.services.brain_usage import (
+                                brain_usage
+                                )
+from personadjango.services.brain_cache import (
+                                brain_cache,
+                                estimate_index_bytes
+                                )
+from personadjango.helper.manipulation import (
+                                manipulation_prefilter
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Cold loads of the same brain share one download and index load
+brain_loads = SingleFlight()
+
+# Brains whose index version changed are reloaded here while the loaded index keeps serving
+BRAIN_RELOAD_WORKERS = int(os.environ.get('BRAIN_RELOAD_WORKERS', 2))
+brain_reloads = ThreadPoolExecutor(max_workers=BRAIN_RELOAD_WORKERS, thread_name_prefix='brain-reload')
+pending_reloads = set()
+pending_reloads_lock = Lock()
+
+def check_lazy_load():
+    """
+    Warn when BRAIN_LAZY_LOAD is set but cannot take effect, called once at startup.
+
+    Only the index disk cache keeps an index's files after the load, which a memory-mapped
+    index reads from, so without it every brain is read into memory.
+
+    Returns:
+        bool: True if the vector index of loaded brains is memory-mapped.
+    """
+    if BRAIN_LAZY_LOAD and not INDEX_DISK_CACHE_ENABLED:
+        logging.warning("BRAIN_LAZY_LOAD has no effect with INDEX_DISK_CACHE_ENABLED=False, brain indexes are read into memory")
+        return False
+    return BRAIN_LAZY_LOAD
+
+class BrainLoadError(Exception):
+    """
+    Raised when a brain index cannot be loaded, with the error response to send.
+
+    Args:
+        message (str): The error message for the client.
+        data (str): The error details for the client.
+        status (int): The HTTP status code.
+    """
+    def __init__(self, message, data, status):
+        super().__init__(message)
+        self.message = message
+        self.data = data
+        self.status = status
+
+def clear_brains(brainName=None):
+    """
+    Remove one brain, or every brain when brainName is None, from the brain cache.
+
+    Args:
+        brainName (str, optional): The name of the brain to remove.
+
+    Returns:
+        bool: True if something was removed from memory, False otherwise.
+    """
+    if brainName is None:
+        removed = brain_cache.clear()
+        logging.info('Cleared all brains from the brain cache')
+        return removed
+
+    removed = brain_cache.pop(brainName)
+    logging.info(f"Cleared specific brain '{brainName}' from the brain cache")
+    return removed
+
+def load_brain_index(brainName, personality_name, files_ranges, version=0, segment_ids=()):
+    """
+    Download a brain index from S3, or take it from the disk cache when unchanged, load it
+    and store it in the brain cache.
+
+    Only one call per brain runs at a time, through brain_loads, because every call works
+    in the same temporary folder.
+
+    Args:
+        brainName (str): The name of the brain.
+        personality_name (str): The personality name of the brain.
+        files_ranges (FileRanges): The file index ranges of the brain.
+        version (int, optional): The index version stamp of the brain's metadata.
+        segment_ids (list, optional): The delta segments of a segmented brain, see services/segments.py.
+
+    Raises:
+        BrainLoadError: If the index could not be downloaded or loaded.
+    """
+    # A load that finished just before this one started already did the work
+    loaded_version = brain_cache.loaded_version(brainName)
+    if loaded_version is not None and loaded_version >= version:
+        return
+    start_time = time.perf_counter()
+
+    if INDEX_DISK_CACHE_ENABLED:
+        temp_folder_path = None
+        try:
+            index_folder_path = run_timed_stage(brainName, 'index_download', index_disk_cache.fetch, brainName)
+        except FileNotFoundError as e:
+            logging.error(f"For BrainID - {brainName}, No Index Found In S3 Bucket - {os.environ.get('BUCKET_NAME')}")
+            raise BrainLoadError("Brain does not exist!", "Brain or Brain Index Does not exist", 404) from e
+        except Exception as e:
+            logging.error(f"For BrainID - {brainName}, Failed To Fetch Index Into Disk Cache from S3 Bucket - {os.environ.get('BUCKET_NAME')}")
+            raise BrainLoadError("Failed to load brain in memory!", str(e), 500) from e
+    else:
+        temp_folder_path = index_folder_path = f"{os.environ.get('TEMP_CONNECTION_INDEX_STORAGE')}/{brainName}/"
+        if not os.path.exists(temp_folder_path):
+            os.makedirs(f'{temp_folder_path}')
+            logging.info(f'For BrainID - {brainName}, Temp Index Storage Allocated at - {temp_folder_path}')
+        try:
+            run_timed_stage(brainName, 'index_download', download_files_from_s3, os.environ.get('BUCKET_NAME'), (f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}"), temp_folder_path)
+            logging.info(f"For BrainID - {brainName}, Index File Content Downloaded From S3 Bucket to {temp_folder_path}")
+        except Exception as e:
+            logging.error(f"For BrainID - {brainName}, Failed To Download Index To {temp_folder_path} from S3 Bucket - {os.environ.get('BUCKET_NAME')}")
+            raise BrainLoadError("Failed to load brain in memory!", str(e), 500) from e
+
+    # Only the disk cache keeps the folder, a mapped index needs its files after the load
+    load_config = mapped_load_config(index_folder_path) if BRAIN_LAZY_LOAD and not temp_folder_path else None
+    embedding_name = embedding_models.embeddings(hybrid=True)
+    try:
+        run_timed_stage(brainName, 'index_load', embedding_name.load, index_folder_path, config=load_config)
+        logging.info(f"For BrainID - {brainName}, Embedding {'Mapped' if load_config else 'Loaded'} From {index_folder_path}")
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName}, Failed To Load Embedding Index To {index_folder_path}")
+        raise BrainLoadError("Brain does not exist!", "Brain or Brain Index Does not exist", 404) from e
+
+    index_bytes = estimate_index_bytes(embedding_name, index_folder_path, ANN_FILE_NAME if load_config else None)
+    # The disk cache keeps its copy for the next load, the temporary folder is not reused
+    if temp_folder_path:
+        delete_folder_content(temp_folder_path)
+
+    # Segmented brains are searched across their delta segments, without the tombstoned ids
+    if SEGMENTED_INDEX or segment_ids:
+        try:
+            deltas, segment_bytes = run_timed_stage(brainName, 'segment_load', load_segments, brainName, list(segment_ids))
+        except Exception as e:
+            logging.error(f"For BrainID - {brainName}, Failed To Load Index Segments {list(segment_ids)}")
+            raise BrainLoadError("Failed to load brain in memory!", str(e), 500) from e
+        embedding_name = SegmentedIndex(embedding_name, deltas, files_ranges)
+        index_bytes += segment_bytes
+
+    brain_cache.put(brainName, embedding_name, personality_name, files_ranges, index_bytes, version, time.perf_counter() - start_time)
+
+def reload_brain(brainName, personality_name, files_ranges, version, segment_ids=()):
+    """
+    Load a newer index version of a brain and replace the loaded one, run by schedule_reload.
+    """
+    try:
+        brain_loads.run(brainName, load_brain_index, brainName, personality_name, files_ranges, version, segment_ids)
+        logging.info(f"For BrainID - {brainName}, Reloaded index version {version}")
+    except BrainLoadError as e:
+        logging.error(f"For BrainID - {brainName}, Failed to reload index version {version}: {e.data}")
+    finally:
+        with pending_reloads_lock:
+            pending_reloads.discard(brainName)
+
+def schedule_reload(brainName, personality_name, files_ranges, version, segment_ids=()):
+    """
+    Reload a brain in the background after its index changed, at most one reload per brain at a time.
+
+    Args:
+        brainName (str): The name of the brain.
+        personality_name (str): The personality name of the brain.
+        files_ranges (FileRanges): The file index ranges of the new index version.
+        version (int): The index version stamp to load.
+        segment_ids (list, optional): The delta segments of the new index version.
+    """
+    with pending_reloads_lock:
+        if brainName in pending_reloads:
+            return
+        pending_reloads.add(brainName)
+    logging.info(f"For BrainID - {brainName}, Index version {version} published, reloading in background")
+    brain_reloads.submit(reload_brain, brainName, personality_name, files_ranges, version, segment_ids)
+
+def load_brain(brainName, record_usage=True):
+    """
+    Read the brain metadata and make sure its embedding index is loaded in the brain cache.
+
+    When the metadata carries a newer index version than the loaded index, the request is
+    served from the loaded index and the new version is loaded in the background.
+
+    Args:
+        brainName (str): The name of the brain.
+        record_usage (bool, optional): Count the call as a request for the brain, False for prewarming.
+
+    Returns:
+        tuple: (JsonResponse, None) if the brain could not be loaded, otherwise (None, dict)
+               with the brain's 'personality_name' and 'files' index ranges.
+    """
+    # Drop brains nobody asked for lately before possibly loading another one
+    brain_cache.evict_idle()
+    if record_usage:
+        brain_usage.record(brainName)
+
+    # Load personality name and file index ranges for the brain
+    try:
+        file_index_ranges, files_ranges = read_current_metadata(brainName)
+        personality_name = file_index_ranges['personality_name']
+        logging.info(f"For BrainID - {brainName}, Loaded Personality Name : {personality_name}")
+        logging.info(f"For BrainID - {brainName}, Loaded File Index Ranges: {files_ranges.files}")
+        version = metadata_version(file_index_ranges)
+        segment_ids = [segment['id'] for segment in file_index_ranges.get('segments', [])]
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName}, Failed to Load Personality Name and File Index Ranges")
+        return send_error(data=str(e), message="Failed to load brain information!", status=500), None
+
+    # If the brain is not in memory, load it, concurrent requests wait for the same load
+    loaded_version = brain_cache.loaded_version(brainName)
+    if loaded_version is None:
+        start_time = time.perf_counter()
+        try:
+            brain_loads.run(brainName, load_brain_index, brainName, personality_name, files_ranges, version, segment_ids)
+        except BrainLoadError as e:
+            return send_error(data=e.data, message=e.message, status=e.status), None
+        brain_cache.record_wait(brainName, time.perf_counter() - start_time)
+    elif loaded_version < version:
+        schedule_reload(brainName, personality_name, files_ranges, version, segment_ids)
+
+    return None, {'personality_name': personality_name, 'files': files_ranges.files}
+
+def brain_stats():
+    """
+    Report the memory and usage stats of this worker process.
+
+    Returns:
+        dict: The loaded brains and their totals (see BrainCache.stats), the index loads
+              (see SingleFlight.stats), the background reloads and compactions, the index disk cache, the
+              metadata cache, the shared vector models, the S3 version checks and the manipulation prefilter counters.
+    """
+    stats = brain_cache.stats()
+    with pending_reloads_lock:
+        reloading = sorted(pending_reloads)
+    with pending_compactions_lock:
+        compacting = sorted(pending_compactions)
+    stats.update({
+        'pid': os.getpid(),
+        'loads': brain_loads.stats(),
+        'reloading': reloading,
+        'compacting': compacting,
+        'disk_cache': index_disk_cache.stats() if INDEX_DISK_CACHE_ENABLED else None,
+        'metadata_cache': metadata_cache.stats(),
+        'embedding_models': embedding_models.names(),
+        'version_checks': remote_metadata.checks,
+        'manipulation_prefilter': manipulation_prefilter.stats(),
+    })
+    return stats
+
+def search_brain(brainName, query, limit=7):
+    """
+    Search a loaded brain and format the hits as prompt context.
+
+    Args:
+        brainName (str): The name of the brain, it must already be loaded by load_brain.
+        query (str): The search query.
+        limit (int, optional): The number of results to return (default is 7).
+
+    Returns:
+        str: One "<file name> --> <text>" line per search result.
+    """
+    with brain_cache.use(brainName) as brain:  # A reload swapping the index in does not affect this search
+        if brain is None:
+            raise LookupError(f"Brain {brainName} was evicted from memory before the search, please retry")
+        output = " "
+        res = run_timed_stage(brainName, 'retrieval', brain['embeddings'].search, query, limit)
+        logging.info(f"For BrainID - {brainName}, Search Result : {res}")
+        for i in range(0, len(res)):
+            file_name = brain['files'].file_name(int(res[i]['id']))
+            if file_name is None:   # Deleted from a segmented brain but not compacted yet
+                continue
+            output = output + (file_name) + " --> " + (res[i]['text']) + "\n"
+    return output
+
+def embed_text(brainName, text):
+    """
+    Encode a text with the vector model of a loaded brain.
+
+    Args:
+        brainName (str): The name of the brain.
+        text (str): The text to encode.
+
+    Returns:
+        numpy.ndarray: The text's vector, or None if the brain is not in memory.
+    """
+    with brain_cache.use(brainName) as brain:
+        if brain is None:
+            return None
+        return brain['embeddings'].transform(text)
@@ -0,0 +1,101 @@
+import os
+import json
+import logging
+from threading import Lock
+from dotenv import load_dotenv
+from txtai.embeddings import Embeddings
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Share one copy of each vector model between all the brain indexes of a process
+EMBEDDING_MODEL_SHARING = os.environ.get('EMBEDDING_MODEL_SHARING', 'True').lower() in ['true']
+
+# Memory-map the vector index of loaded brains, pages are read from disk when searches touch them
+BRAIN_LAZY_LOAD = os.environ.get('BRAIN_LAZY_LOAD', 'False').lower() in ['true']
+
+# Name of the vector index file in a saved txtai index folder
+ANN_FILE_NAME = 'embeddings'
+
+def mapped_load_config(index_path):
+    """
+    Build the load configuration overrides that memory-map a saved index's vectors.
+
+    Only the Faiss backend can be memory-mapped, its other saved settings are kept.
+
+    Args:
+        index_path (str): The saved index folder.
+
+    Returns:
+        dict: The overrides to pass to Embeddings.load, or None if the index cannot be mapped.
+    """
+    try:
+        with open(os.path.join(index_path, 'config.json'), 'r') as file:
+            config = json.load(file)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Failed to read index configuration in {index_path}, loading it in memory: {e}")
+        return None
+    if config.get('backend', 'faiss') != 'faiss':
+        return None
+    return {'faiss': {**config.get('faiss', {}), 'mmap': True}}
+
+class SharedModelEmbeddings(Embeddings):
+    """
+    A txtai index that creates its vector model under the registry lock.
+
+    txtai looks the model up in the shared cache and loads it when it is missing, so two
+    indexes loading at the same time would each load it. Under the lock the second one
+    finds the model the first one stored.
+
+    Args:
+        model_lock (Lock): The lock of the registry the models are shared in.
+        models (dict): The shared models cache.
+        **kwargs: The Embeddings configuration.
+    """
+    def __init__(self, model_lock, models, **kwargs):
+        # Set first, txtai creates the model while it configures the index
+        self.model_lock = model_lock
+        super().__init__(models=models, **kwargs)
+
+    def loadvectors(self):
+        with self.model_lock:
+            return super().loadvectors()
+
+class EmbeddingModelRegistry:
+    """
+    The vector models loaded by this process, handed to every txtai index.
+
+    txtai looks a model up by its path in the models cache given to Embeddings before
+    loading it, and adds the models it loads, so each configured model is loaded once
+    and the brains only hold their own vectors and content. Model creation is serialized,
+    so concurrent cold loads of several brains still load a model only once.
+
+    Args:
+        enabled (bool): Share the models, False gives every index its own copy.
+    """
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.models = {}
+        self.lock = Lock()
+
+    def embeddings(self, **kwargs):
+        """
+        Create a txtai index that uses the shared vector models.
+
+        Args:
+            **kwargs: The Embeddings configuration, such as hybrid and content.
+
+        Returns:
+            Embeddings: The new, empty index, to load or build.
+        """
+        if not self.enabled:
+            return Embeddings(**kwargs)
+        return SharedModelEmbeddings(self.lock, self.models, **kwargs)
+
+    def names(self):
+        """
+        Return the paths of the vector models loaded so far.
+        """
+        return list(self.models)
+
+embedding_models = EmbeddingModelRegistry(EMBEDDING_MODEL_SHARING)
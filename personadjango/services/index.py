@@ -1,10 +1,116 @@
 import os
 import json
 import logging
+from bisect import bisect_right
+from threading import Lock
 from dotenv import load_dotenv
 
 load_dotenv()
 
+class FileRanges:
+    """
+    The file index ranges of a brain with a sorted table to find the file of a document id.
+
+    Args:
+        files (dict): The file names mapped to their [first id, last id] range.
+    """
+    def __init__(self, files):
+        self.files = files
+        self.table = sorted((first, last, name) for name, (first, last) in files.items())
+        self.starts = [first for first, _, _ in self.table]
+
+    def __len__(self):
+        return len(self.files)
+
+    def file_name(self, key):
+        """
+        Find the file a document id belongs to.
+
+        Args:
+            key (int): The document id.
+
+        Returns:
+            str: The file name, or None if no range holds the id.
+        """
+        position = bisect_right(self.starts, key) - 1
+        if position >= 0 and key <= self.table[position][1]:
+            return self.table[position][2]
+        return None
+
+class BrainMetadataCache:
+    """
+    Parsed brain metadata files with their file lookup table, parsed again only when the
+    file's modification time or size changed, so other processes' writes are picked up.
+    """
+    def __init__(self):
+        self.entries = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, brainName):
+        """
+        Return the metadata of a brain, from the cache while its file is unchanged.
+
+        Args:
+            brainName (str): The name of the brain.
+
+        Returns:
+            tuple: (dict, FileRanges) the metadata and its file lookup, shared between
+                   callers and not to be modified.
+
+        Raises:
+            FileNotFoundError: If the brain has no metadata file.
+        """
+        file_path = f"{os.environ.get('FILE_INDEX_RANGE')}/{brainName}.json"
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            self.invalidate(brainName)
+            raise
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            entry = self.entries.get(brainName)
+            if entry is not None and entry[0] == stamp:
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+        metadata = read_file_index_ranges(brainName)
+        file_ranges = FileRanges(metadata.get('files', {}))
+        with self.lock:
+            self.entries[brainName] = (stamp, metadata, file_ranges)
+        return metadata, file_ranges
+
+    def invalidate(self, brainName):
+        """
+        Forget the cached metadata of a brain, after this process wrote or removed its file.
+        """
+        with self.lock:
+            self.entries.pop(brainName, None)
+
+    def stats(self):
+        """
+        Report the cached brains and how often the cache was used.
+        """
+        with self.lock:
+            return {'brains': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+metadata_cache = BrainMetadataCache()
+
+def read_brain_metadata(brainName):
+    """
+    Read a brain's metadata through the metadata cache, for the request path.
+
+    The result is shared, use read_file_index_ranges to get a copy to modify and save.
+
+    Args:
+        brainName (str): The name of the brain.
+
+    Returns:
+        tuple: (dict, FileRanges) the metadata and the lookup of its file index ranges.
+    """
+    return metadata_cache.get(brainName)
+
 def read_file_index_ranges(brainName):
     """
     Read file index ranges from a JSON file.
@@ -39,10 +145,29 @@ def save_file_index_ranges(brainName, dict):
         with open(file_path, 'w') as file:
             json.dump(dict, file)
         logging.info('File index ranges successfully saved')
+        metadata_cache.invalidate(brainName)
     except Exception as e:
         logging.error(f'Error saving file index ranges to {file_path}: {e}')
         raise
 
+def bump_index_version(brainName):
+    """
+    Increment the index version stamp in a brain's metadata after its index was rewritten.
+
+    Workers compare the stamp with the version of the index they loaded, see load_brain.
+
+    Args:
+        brainName (str): The name of the brain whose index changed.
+
+    Returns:
+        int: The new index version.
+    """
+    file_index_ranges = read_file_index_ranges(brainName)
+    file_index_ranges['index_version'] = file_index_ranges.get('index_version', 0) + 1
+    save_file_index_ranges(brainName, file_index_ranges)
+    logging.info(f"For BrainID - {brainName}, Index version bumped to {file_index_ranges['index_version']}")
+    return file_index_ranges['index_version']
+
 def delete_folder_content(folder_path):
     """
     Delete all content in a folder and then remove the folder.
@@ -85,4 +210,5 @@ def rename_local_index_file(old_brainName, new_brainName):
 
     # Delete the old file
     os.remove(old_file_path)
+    metadata_cache.invalidate(old_brainName)
     logging.info(f"Old index file {old_file_path} deleted successfully")
\ No newline at end of file
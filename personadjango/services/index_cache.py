@@ -0,0 +1,350 @@
+import os
+import time
+import shutil
+import hashlib
+import logging
+from threading import Lock
+from dotenv import load_dotenv
+from personadjango.services.s3 import (
+                                list_s3_folder_files,
+                                download_s3_files,
+                                download_files_from_s3,
+                                segment_index_repo
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Keep downloaded brain indexes on disk and reuse them while their S3 objects are unchanged
+INDEX_DISK_CACHE_ENABLED = os.environ.get('INDEX_DISK_CACHE_ENABLED', 'True').lower() in ['true']
+INDEX_DISK_CACHE_DIR = os.environ.get('INDEX_DISK_CACHE_DIR', 'indexcache')
+INDEX_DISK_CACHE_MAX_BYTES = int(os.environ.get('INDEX_DISK_CACHE_MAX_BYTES', 10 * 1024 ** 3))
+# Seconds after which an unfinished download is abandoned even if its process still runs
+INDEX_DISK_CACHE_PARTIAL_TTL = int(os.environ.get('INDEX_DISK_CACHE_PARTIAL_TTL', 3600))
+
+# Sub folder of a brain's cache folder holding its delta segments, see services/segments.py
+SEGMENTS_FOLDER = 'segments'
+
+def partial_is_stale(folder, ttl):
+    """
+    Tell whether an unfinished download folder was left behind by a failed or dead download.
+
+    Args:
+        folder (str): The '<version>.<pid>.<time>.partial' folder.
+        ttl (int): Seconds after which the download is abandoned anyway.
+
+    Returns:
+        bool: True if the process that made it is gone or it is older than ttl.
+    """
+    try:
+        if time.time() - os.path.getmtime(folder) > ttl:
+            return True
+    except OSError:
+        return False
+    try:
+        pid = int(os.path.basename(folder).split('.')[-3])
+    except (IndexError, ValueError):
+        return True
+    if pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        # The process exists but belongs to another user
+        return False
+    return False
+
+def folder_bytes(folder):
+    """
+    Return the size of the files directly in a folder.
+    """
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+
+def index_files(brainName, files):
+    """
+    Keep the txtai index files of a brain's S3 folder, without the brain metadata file.
+
+    The metadata file shares the folder and is uploaded again after every upload, delete and
+    segment add, while the index files only change when the base index is rebuilt.
+
+    Args:
+        brainName (str): The name of the brain.
+        files (dict): The S3 keys mapped to {'etag', 'size'}, as listed by list_s3_folder_files.
+
+    Returns:
+        dict: The same mapping without the '<brainName>.json' key.
+    """
+    metadata_file = f"{brainName}.json"
+    return {key: info for key, info in files.items() if os.path.basename(key) != metadata_file}
+
+def index_version(files):
+    """
+    Derive a version id from the ETags of a brain's index files.
+
+    Args:
+        files (dict): The S3 keys mapped to {'etag', 'size'}, as listed by list_s3_folder_files.
+
+    Returns:
+        str: A short hash that changes whenever any index file changes.
+    """
+    digest = hashlib.sha1()
+    for key in sorted(files):
+        digest.update(f"{os.path.basename(key)}:{files[key]['etag']}\n".encode())
+    return digest.hexdigest()[:16]
+
+class IndexDiskCache:
+    """
+    Local copies of brain indexes, one folder per brain and index version.
+
+    A version folder is complete before it is renamed into place and never changes
+    afterwards, so it can be loaded while a newer version is being downloaded. Delta
+    segments never change either and are kept per segment id. The least recently used
+    versions and segments are removed once the cache exceeds its disk quota.
+
+    Unfinished downloads are '.partial' folders. They count against the quota, and the ones
+    left by a failed download or a dead process are removed on the brain's next fetch.
+
+    Args:
+        root (str): The cache directory.
+        max_bytes (int): Disk quota of the cache.
+        partial_ttl (int): Seconds after which an unfinished download is removed.
+    """
+    def __init__(self, root, max_bytes, partial_ttl=INDEX_DISK_CACHE_PARTIAL_TTL):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.partial_ttl = partial_ttl
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def brain_folder(self, brainName):
+        return os.path.join(self.root, brainName)
+
+    def partial_folders(self, brainName):
+        """
+        List the unfinished downloads of a brain's versions and segments.
+        """
+        brain_folder = self.brain_folder(brainName)
+        partials = []
+        for folder in (brain_folder, os.path.join(brain_folder, SEGMENTS_FOLDER)):
+            if os.path.isdir(folder):
+                partials += [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith('.partial')]
+        return partials
+
+    def remove_stale_partials(self, brainName):
+        """
+        Remove the unfinished downloads of a brain that no running download will complete.
+
+        Args:
+            brainName (str): The name of the brain.
+        """
+        for folder in self.partial_folders(brainName):
+            if partial_is_stale(folder, self.partial_ttl):
+                shutil.rmtree(folder, ignore_errors=True)
+                logging.info(f"For BrainID - {brainName}, Removed abandoned download {folder} from disk cache")
+
+    def fetch(self, brainName):
+        """
+        Return a local folder holding the current index of a brain, downloading it only if
+        the S3 index files changed since the cached copy was made. The brain metadata file
+        is neither part of the version nor downloaded, so a metadata change alone downloads nothing.
+
+        Args:
+            brainName (str): The name of the brain.
+
+        Returns:
+            str: The folder to load the index from.
+
+        Raises:
+            FileNotFoundError: If the brain has no index in S3.
+        """
+        self.remove_stale_partials(brainName)
+        bucket = os.environ.get('BUCKET_NAME')
+        files = index_files(brainName, list_s3_folder_files(bucket, f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}"))
+        if not files:
+            self.evict(brainName)
+            raise FileNotFoundError(f"No index files for brain {brainName} in S3")
+
+        version = index_version(files)
+        version_folder = os.path.join(self.brain_folder(brainName), version)
+        if os.path.isdir(version_folder):
+            os.utime(version_folder)   # Marks the version as recently used for the quota eviction
+            with self.lock:
+                self.hits += 1
+            logging.info(f"For BrainID - {brainName}, Index version {version} served from disk cache")
+            return version_folder
+
+        with self.lock:
+            self.misses += 1
+        download_folder = f"{version_folder}.{os.getpid()}.{time.time_ns()}.partial"
+        os.makedirs(download_folder)
+        try:
+            download_s3_files(bucket, list(files), download_folder)
+            try:
+                os.rename(download_folder, version_folder)
+            except OSError:
+                # Another worker process finished the same version first
+                shutil.rmtree(download_folder, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(download_folder, ignore_errors=True)
+            raise
+        logging.info(f"For BrainID - {brainName}, Index version {version} downloaded to disk cache")
+
+        self.remove_other_versions(brainName, version)
+        self.enforce_quota(keep=version_folder)
+        return version_folder
+
+    def fetch_segment(self, brainName, segment_id):
+        """
+        Return a local folder holding a delta segment of a brain, downloading it on first use.
+
+        Args:
+            brainName (str): The name of the brain.
+            segment_id (str): The id of the segment.
+
+        Returns:
+            str: The folder to load the segment from.
+        """
+        segment_folder = os.path.join(self.brain_folder(brainName), SEGMENTS_FOLDER, segment_id)
+        if os.path.isdir(segment_folder):
+            os.utime(segment_folder)
+            with self.lock:
+                self.hits += 1
+            return segment_folder
+
+        with self.lock:
+            self.misses += 1
+        download_folder = f"{segment_folder}.{os.getpid()}.{time.time_ns()}.partial"
+        os.makedirs(download_folder)
+        try:
+            download_files_from_s3(os.environ.get('BUCKET_NAME'), f"{segment_index_repo()}/{brainName}/{segment_id}/", download_folder)
+            try:
+                os.rename(download_folder, segment_folder)
+            except OSError:
+                shutil.rmtree(download_folder, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(download_folder, ignore_errors=True)
+            raise
+        logging.info(f"For BrainID - {brainName}, Index segment {segment_id} downloaded to disk cache")
+        self.enforce_quota(keep=segment_folder)
+        return segment_folder
+
+    def remove_other_segments(self, brainName, segment_ids):
+        """
+        Remove the cached delta segments of a brain that were compacted into its base index.
+
+        Args:
+            brainName (str): The name of the brain.
+            segment_ids (list): The segments the brain still has.
+        """
+        segments_folder = os.path.join(self.brain_folder(brainName), SEGMENTS_FOLDER)
+        if not os.path.isdir(segments_folder):
+            return
+        for name in os.listdir(segments_folder):
+            if name not in segment_ids and not name.endswith('.partial'):
+                shutil.rmtree(os.path.join(segments_folder, name), ignore_errors=True)
+
+    def remove_other_versions(self, brainName, version):
+        """
+        Remove the outdated versions of a brain's index and its abandoned downloads.
+        """
+        self.remove_stale_partials(brainName)
+        brain_folder = self.brain_folder(brainName)
+        for name in os.listdir(brain_folder):
+            if name not in (version, SEGMENTS_FOLDER) and not name.endswith('.partial'):
+                shutil.rmtree(os.path.join(brain_folder, name), ignore_errors=True)
+
+    def evict(self, brainName):
+        """
+        Remove every cached version of a brain's index, after the brain was deleted or renamed.
+
+        Args:
+            brainName (str): The name of the brain.
+        """
+        brain_folder = self.brain_folder(brainName)
+        if os.path.isdir(brain_folder):
+            shutil.rmtree(brain_folder, ignore_errors=True)
+            logging.info(f"For BrainID - {brainName}, Index removed from disk cache")
+
+    def versions(self):
+        """
+        List the cached index versions.
+
+        Returns:
+            list: (last used timestamp, size in bytes, folder) for every complete version and segment.
+        """
+        versions = []
+        if not os.path.isdir(self.root):
+            return versions
+        for brainName in os.listdir(self.root):
+            brain_folder = self.brain_folder(brainName)
+            if not os.path.isdir(brain_folder):
+                continue
+            folders = [os.path.join(brain_folder, name) for name in os.listdir(brain_folder) if name != SEGMENTS_FOLDER]
+            segments_folder = os.path.join(brain_folder, SEGMENTS_FOLDER)
+            if os.path.isdir(segments_folder):
+                folders += [os.path.join(segments_folder, name) for name in os.listdir(segments_folder)]
+            for folder in folders:
+                if folder.endswith('.partial') or not os.path.isdir(folder):
+                    continue
+                size = folder_bytes(folder)
+                versions.append((os.path.getmtime(folder), size, folder))
+        return versions
+
+    def partial_bytes(self):
+        """
+        Return the size of all unfinished downloads in the cache.
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        total = 0
+        for brainName in os.listdir(self.root):
+            for folder in self.partial_folders(brainName):
+                try:
+                    total += folder_bytes(folder)
+                except OSError:
+                    # Renamed into place or removed meanwhile
+                    continue
+        return total
+
+    def enforce_quota(self, keep=None):
+        """
+        Remove the least recently used versions while the cache exceeds its disk quota.
+
+        Unfinished downloads count against the quota but are never removed here.
+
+        Args:
+            keep (str, optional): A version folder that must stay, the one just downloaded.
+        """
+        versions = sorted(self.versions())
+        total = sum(size for _, size, _ in versions) + self.partial_bytes()
+        for _, size, folder in versions:
+            if total <= self.max_bytes:
+                break
+            if folder == keep:
+                continue
+            shutil.rmtree(folder, ignore_errors=True)
+            total -= size
+            logging.info(f"Removed {folder} from disk cache to stay within {self.max_bytes} bytes")
+
+    def stats(self):
+        """
+        Report the disk cache usage.
+
+        Returns:
+            dict: Hit and miss counts, cached versions and their total size in bytes.
+        """
+        versions = self.versions()
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'versions': len(versions),
+                'bytes': sum(size for _, size, _ in versions),
+                'partial_bytes': self.partial_bytes(),
+                'max_bytes': self.max_bytes,
+            }
+
+index_disk_cache = IndexDiskCache(INDEX_DISK_CACHE_DIR, INDEX_DISK_CACHE_MAX_BYTES)
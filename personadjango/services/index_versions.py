@@ -0,0 +1,121 @@
+import os
+import time
+import logging
+from threading import Lock
+from dotenv import load_dotenv
+from personadjango.services.s3 import (
+                                read_index_metadata_from_s3
+                                )
+from personadjango.services.index import (
+                                read_brain_metadata,
+                                save_file_index_ranges
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Seconds the brain metadata read from S3 is trusted, 0 only follows the local metadata file
+INDEX_VERSION_CHECK_TTL = int(os.environ.get('INDEX_VERSION_CHECK_TTL', 30))
+
+def metadata_version(metadata):
+    """
+    Return the index version stamp of a brain's metadata, 0 for brains written before stamps existed.
+    """
+    return (metadata or {}).get('index_version', 0)
+
+class RemoteMetadataCache:
+    """
+    The brain metadata last uploaded to S3, read again at most once per TTL and brain.
+
+    Index writes bump the version stamp in the metadata and upload it next to the index,
+    so workers on other nodes see the change within the TTL at the cost of one small read.
+
+    Args:
+        ttl (int): Seconds a read stays valid, 0 disables the S3 check.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = Lock()
+        self.checks = 0
+
+    def get(self, brainName):
+        """
+        Return the S3 metadata of a brain, read from S3 when the cached copy expired.
+
+        Args:
+            brainName (str): The name of the brain.
+
+        Returns:
+            dict: The metadata, or None if the check is disabled, failed or the brain has none.
+        """
+        if self.ttl <= 0:
+            return None
+        now = time.time()
+        with self.lock:
+            checked_at, metadata, missing = self.entries.get(brainName, (0, None, False))
+            if now - checked_at < self.ttl:
+                return metadata
+            # Concurrent requests keep the previous copy while this one reads S3
+            self.entries[brainName] = (now, metadata, missing)
+            self.checks += 1
+        try:
+            metadata = read_index_metadata_from_s3(brainName)
+            missing = metadata is None
+        except Exception as e:
+            logging.warning(f"For BrainID - {brainName}, Failed to check index version in S3: {e}")
+        with self.lock:
+            self.entries[brainName] = (now, metadata, missing)
+        return metadata
+
+    def missing(self, brainName):
+        """
+        Tell whether the last S3 read found no metadata for a brain, a failed read does not count.
+
+        Args:
+            brainName (str): The name of the brain, checked by get first.
+
+        Returns:
+            bool: True if the brain was deleted or renamed, or never had metadata in S3.
+        """
+        with self.lock:
+            return self.entries.get(brainName, (0, None, False))[2]
+
+    def invalidate(self, brainName):
+        """
+        Forget the S3 metadata of a brain, after it was deleted or renamed.
+        """
+        with self.lock:
+            self.entries.pop(brainName, None)
+
+remote_metadata = RemoteMetadataCache(INDEX_VERSION_CHECK_TTL)
+
+def read_current_metadata(brainName):
+    """
+    Read a brain's metadata, taking the S3 copy when another node wrote a newer index version.
+
+    The newer copy replaces the local metadata file, so this node's other workers and
+    its writes continue from it.
+
+    Args:
+        brainName (str): The name of the brain.
+
+    Returns:
+        tuple: (dict, FileRanges) the brain metadata with its 'personality_name', 'files'
+               and 'index_version', and the lookup of its file index ranges, see read_brain_metadata.
+
+    Raises:
+        FileNotFoundError: If the brain has no metadata, locally or in S3.
+    """
+    try:
+        metadata, file_ranges = read_brain_metadata(brainName)
+    except FileNotFoundError:
+        metadata = None
+    remote = remote_metadata.get(brainName)
+    if remote is not None and (metadata is None or metadata_version(remote) > metadata_version(metadata)):
+        logging.info(f"For BrainID - {brainName}, Index version {metadata_version(remote)} found in S3, local metadata updated")
+        save_file_index_ranges(brainName, remote)
+        metadata, file_ranges = read_brain_metadata(brainName)
+    if metadata is None:
+        raise FileNotFoundError(f"No metadata for brain {brainName}")
+    return metadata, file_ranges
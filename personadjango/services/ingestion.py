@@ -0,0 +1,430 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import logging
+from threading import Event, Thread
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Uploads are queued as jobs and processed by background workers instead of inside the request
+INGESTION_QUEUE_ENABLED = os.environ.get('INGESTION_QUEUE_ENABLED', 'False').lower() in ['true']
+# The jobs are kept in a SQLite file, shared by the processes of this node, and the uploaded files in the spool folder
+INGESTION_QUEUE_DB = os.environ.get('INGESTION_QUEUE_DB', 'ingestion_jobs.sqlite3')
+INGESTION_SPOOL_DIR = os.environ.get('INGESTION_SPOOL_DIR', 'ingestion_spool')
+# Worker threads per server process, 0 leaves the jobs to the run_ingestion_workers command
+INGESTION_WORKERS = int(os.environ.get('INGESTION_WORKERS', 2))
+# Seconds between two looks at the queue when it is empty
+INGESTION_POLL_INTERVAL = float(os.environ.get('INGESTION_POLL_INTERVAL', 2))
+# A running job without a heartbeat for this many seconds was left by a dead worker and is queued again
+INGESTION_JOB_TIMEOUT = int(os.environ.get('INGESTION_JOB_TIMEOUT', 3600))
+# Seconds between two heartbeats of a running job
+INGESTION_HEARTBEAT_INTERVAL = float(os.environ.get('INGESTION_HEARTBEAT_INTERVAL', 60))
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_FINISHED = 'finished'
+JOB_FAILED = 'failed'
+
+SCHEMA = """
+create table if not exists jobs (
+    id text primary key,
+    brain text not null,
+    status text not null,
+    created real not null,
+    started real,
+    finished real,
+    heartbeat real,
+    worker text,
+    error text
+);
+create table if not exists files (
+    job_id text not null,
+    position integer not null,
+    filename text not null,
+    path text not null,
+    status text not null,
+    error text,
+    seconds real,
+    primary key (job_id, position)
+);
+create index if not exists jobs_status on jobs (status, created);
+"""
+
+class IngestionQueue:
+    """
+    Upload jobs and the progress of their files, kept in a SQLite database.
+
+    Jobs are claimed in a write transaction, so the workers of all server processes share
+    the queue without an external broker. At most one job per brain runs at a time, as the
+    uploads of a brain rewrite the same index.
+
+    Args:
+        path (str): The SQLite database file, created on first use.
+        spool_dir (str): The folder the files of queued jobs are saved to.
+    """
+    def __init__(self, path, spool_dir):
+        self.path = path
+        self.spool_dir = spool_dir
+        self.ready = False
+
+    def connect(self):
+        """
+        Open a connection in autocommit mode, transactions are started explicitly.
+        """
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        if not self.ready:
+            connection.executescript(SCHEMA)
+            self.ready = True
+        return connection
+
+    def enqueue(self, brainName, files):
+        """
+        Save the uploaded files to the spool folder and queue a job ingesting them.
+
+        Args:
+            brainName (str): The name of the brain.
+            files (list): The uploaded files.
+
+        Returns:
+            str: The id of the job.
+        """
+        job_id = uuid.uuid4().hex
+        job_folder = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_folder, exist_ok=True)
+        rows = []
+        for position, file in enumerate(files):
+            # Prefixed with the position, two files of a job may have the same name
+            path = os.path.join(job_folder, f"{position}-{os.path.basename(file.name or 'file')}")
+            with open(path, 'wb') as spooled:
+                for chunk in file.chunks():
+                    spooled.write(chunk)
+            rows.append((job_id, position, file.name or '', path, JOB_QUEUED))
+
+        connection = self.connect()
+        try:
+            connection.execute('begin immediate')
+            connection.executemany('insert into files (job_id, position, filename, path, status) values (?, ?, ?, ?, ?)', rows)
+            connection.execute('insert into jobs (id, brain, status, created) values (?, ?, ?, ?)', (job_id, brainName, JOB_QUEUED, time.time()))
+            connection.execute('commit')
+        except Exception:
+            connection.execute('rollback')
+            shutil.rmtree(job_folder, ignore_errors=True)
+            raise
+        finally:
+            connection.close()
+        logging.info(f"For BrainID - {brainName}, Ingestion job {job_id} queued with {len(rows)} files")
+        return job_id
+
+    def claim(self, worker):
+        """
+        Take the oldest queued job of a brain that has no running job.
+
+        Args:
+            worker (str): The name of the claiming worker, reported by the status.
+
+        Returns:
+            tuple: (job id, brain name, list of (position, filename, path) of the files not
+                   processed yet), or None if no job can run now.
+        """
+        now = time.time()
+        connection = self.connect()
+        try:
+            connection.execute('begin immediate')
+            # Jobs of dead workers are queued again, their processed files are not redone
+            connection.execute('update jobs set status = ?, worker = null where status = ? and heartbeat < ?',
+                               (JOB_QUEUED, JOB_RUNNING, now - INGESTION_JOB_TIMEOUT))
+            row = connection.execute(
+                'select id, brain from jobs where status = ? and brain not in (select brain from jobs where status = ?) order by created limit 1',
+                (JOB_QUEUED, JOB_RUNNING)).fetchone()
+            if row is None:
+                connection.execute('commit')
+                return None
+            connection.execute('update jobs set status = ?, started = coalesce(started, ?), heartbeat = ?, worker = ? where id = ?',
+                               (JOB_RUNNING, now, now, worker, row['id']))
+            files = connection.execute('select position, filename, path from files where job_id = ? and status = ? order by position',
+                                       (row['id'], JOB_QUEUED)).fetchall()
+            connection.execute('commit')
+        except Exception:
+            connection.execute('rollback')
+            raise
+        finally:
+            connection.close()
+        return row['id'], row['brain'], [(file['position'], file['filename'], file['path']) for file in files]
+
+    def heartbeat(self, job_id, worker):
+        """
+        Show that a worker is still running a job, so claim does not queue it again.
+
+        Args:
+            job_id (str): The id of the job.
+            worker (str): The worker running it.
+
+        Returns:
+            bool: False if the job is no longer running for this worker.
+        """
+        connection = self.connect()
+        try:
+            cursor = connection.execute('update jobs set heartbeat = ? where id = ? and worker = ? and status = ?',
+                                        (time.time(), job_id, worker, JOB_RUNNING))
+            return cursor.rowcount > 0
+        finally:
+            connection.close()
+
+    def finish_file(self, job_id, worker, position, error, seconds):
+        """
+        Record the outcome of one file of a job, unless the job was taken away from the worker.
+
+        Args:
+            job_id (str): The id of the job.
+            worker (str): The worker running it.
+            position (int): The position of the file in the job.
+            error (str): None if the file was processed, otherwise the reason it was not.
+            seconds (float): The time spent on the file.
+
+        Returns:
+            bool: False if the job is no longer running for this worker and nothing was recorded.
+        """
+        connection = self.connect()
+        try:
+            connection.execute('begin immediate')
+            if not self.owns(connection, job_id, worker):
+                connection.execute('commit')
+                return False
+            connection.execute('update files set status = ?, error = ?, seconds = ? where job_id = ? and position = ?',
+                               (JOB_FAILED if error else JOB_FINISHED, error, seconds, job_id, position))
+            connection.execute('update jobs set heartbeat = ? where id = ?', (time.time(), job_id))
+            connection.execute('commit')
+            return True
+        except Exception:
+            connection.execute('rollback')
+            raise
+        finally:
+            connection.close()
+
+    def finish_job(self, job_id, worker, error=None):
+        """
+        Mark a job as done and remove its spooled files, unless the job was taken away from the worker.
+
+        Args:
+            job_id (str): The id of the job.
+            worker (str): The worker running it.
+            error (str, optional): The reason the job stopped before all its files were processed.
+
+        Returns:
+            bool: False if the job is no longer running for this worker and was left as it is.
+        """
+        connection = self.connect()
+        try:
+            cursor = connection.execute('update jobs set status = ?, finished = ?, error = ? where id = ? and worker = ? and status = ?',
+                                        (JOB_FAILED if error else JOB_FINISHED, time.time(), error, job_id, worker, JOB_RUNNING))
+            finished = cursor.rowcount > 0
+        finally:
+            connection.close()
+        if finished:
+            shutil.rmtree(os.path.join(self.spool_dir, job_id), ignore_errors=True)
+        return finished
+
+    def owns(self, connection, job_id, worker):
+        """
+        Tell whether a job is running for a worker, within the caller's transaction.
+        """
+        row = connection.execute('select 1 from jobs where id = ? and worker = ? and status = ?', (job_id, worker, JOB_RUNNING)).fetchone()
+        return row is not None
+
+    def job(self, job_id):
+        """
+        Report the status of a job and of each of its files.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            dict: The job 'status', 'error', timestamps and 'seconds', the 'progress' counts
+                  and the 'files' with their status, error and seconds, or None if there is no such job.
+        """
+        connection = self.connect()
+        try:
+            job = connection.execute('select * from jobs where id = ?', (job_id,)).fetchone()
+            files = connection.execute('select position, filename, status, error, seconds from files where job_id = ? order by position',
+                                       (job_id,)).fetchall()
+        finally:
+            connection.close()
+        if job is None:
+            return None
+
+        statuses = [dict(file) for file in files]
+        if job['status'] == JOB_RUNNING:
+            # Files are processed in order, the first one not done is the one in progress
+            for file in statuses:
+                if file['status'] == JOB_QUEUED:
+                    file['status'] = JOB_RUNNING
+                    break
+        done = [file for file in statuses if file['status'] in (JOB_FINISHED, JOB_FAILED)]
+        end = job['finished'] or time.time()
+        return {
+            'job_id': job['id'],
+            'brainName': job['brain'],
+            'status': job['status'],
+            'error': job['error'],
+            'created': job['created'],
+            'started': job['started'],
+            'finished': job['finished'],
+            'queued_seconds': round((job['started'] or end) - job['created'], 3),
+            'seconds': round(end - job['started'], 3) if job['started'] else None,
+            'progress': {
+                'total': len(statuses),
+                'done': len(done),
+                'failed': len([file for file in done if file['status'] == JOB_FAILED]),
+            },
+            'files': statuses,
+        }
+
+ingestion_queue = IngestionQueue(INGESTION_QUEUE_DB, INGESTION_SPOOL_DIR)
+
+class IngestionWorkers:
+    """
+    Threads taking jobs off the ingestion queue and running them.
+
+    While a job runs, a timer thread refreshes its heartbeat, so long index updates are not
+    mistaken for a dead worker.
+
+    Args:
+        queue (IngestionQueue): The queue to work on.
+        handler (callable): Called with (brainName, files, progress) for each job, files being
+                            django File objects and progress a callable taking
+                            (position, filename, status, seconds) with a success status.
+        success (str): The status handler reports for a file that was processed.
+        workers (int): The number of threads.
+        poll_interval (float): Seconds between two looks at an empty queue.
+        heartbeat_interval (float, optional): Seconds between two heartbeats of a running job.
+    """
+    def __init__(self, queue, handler, success, workers, poll_interval, heartbeat_interval=INGESTION_HEARTBEAT_INTERVAL):
+        self.queue = queue
+        self.handler = handler
+        self.success = success
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.wakeup = Event()
+        self.threads = []
+
+    def start(self):
+        """
+        Start the worker threads, they run until the process exits.
+        """
+        for number in range(self.workers):
+            thread = Thread(target=self.run, args=(f"{os.getpid()}-{number}",), name=f'ingestion-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logging.info(f"Started {self.workers} ingestion workers")
+
+    def notify(self):
+        """
+        Wake the idle workers of this process, after a job was queued.
+        """
+        self.wakeup.set()
+
+    def run(self, worker):
+        while True:
+            try:
+                job = self.queue.claim(worker)
+            except Exception as e:
+                logging.error(f"Ingestion worker {worker} failed to read the queue: {e}")
+                job = None
+            if job is None:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+            self.process(worker, *job)
+
+    def beat(self, worker, job_id, done):
+        """
+        Refresh the heartbeat of a job until done is set, run in a timer thread.
+        """
+        while not done.wait(self.heartbeat_interval):
+            try:
+                if not self.queue.heartbeat(job_id, worker):
+                    logging.warning(f"Ingestion job {job_id} is no longer owned by worker {worker}")
+                    return
+            except Exception as e:
+                logging.warning(f"Ingestion worker {worker} failed to refresh the heartbeat of job {job_id}: {e}")
+
+    def process(self, worker, job_id, brainName, files):
+        """
+        Run one job, recording the outcome of each file as the handler reports it.
+
+        Args:
+            worker (str): The name of the worker running the job.
+            job_id (str): The id of the job.
+            brainName (str): The name of the brain.
+            files (list): (position, filename, path) of the files to process.
+        """
+        # Imported here, services are loaded before the Django apps are ready
+        from django.core.files import File
+
+        start_time = time.perf_counter()
+        logging.info(f"For BrainID - {brainName}, Ingestion job {job_id} started with {len(files)} files")
+        positions = [position for position, _, _ in files]
+
+        def progress(index, filename, status, seconds):
+            self.queue.finish_file(job_id, worker, positions[index], None if status == self.success else str(status), seconds)
+
+        done = Event()
+        Thread(target=self.beat, args=(worker, job_id, done), name=f'ingestion-heartbeat-{job_id[:8]}', daemon=True).start()
+        opened = []
+        try:
+            opened = [open(path, 'rb') for _, _, path in files]
+            self.handler(brainName, [File(handle, name=filename) for handle, (_, filename, _) in zip(opened, files)], progress)
+        except Exception as e:
+            logging.error(f"For BrainID - {brainName}, Ingestion job {job_id} failed: {e}")
+            self.queue.finish_job(job_id, worker, str(e))
+            return
+        finally:
+            done.set()
+            for handle in opened:
+                handle.close()
+        if not self.queue.finish_job(job_id, worker):
+            logging.warning(f"For BrainID - {brainName}, Ingestion job {job_id} was queued again while worker {worker} ran it")
+            return
+        logging.info(f"For BrainID - {brainName}, Ingestion job {job_id} finished in {time.perf_counter() - start_time:.1f} s")
+
+ingestion_workers = None
+
+def start_ingestion_workers(handler, success, workers=INGESTION_WORKERS):
+    """
+    Start this process' ingestion workers, once.
+
+    Args:
+        handler (callable): The function ingesting the files of a job, see IngestionWorkers.
+        success (str): The status handler reports for a file that was processed.
+        workers (int, optional): The number of threads, nothing is started for 0.
+
+    Returns:
+        IngestionWorkers: The running workers, or None if none were started.
+    """
+    global ingestion_workers
+    if ingestion_workers is None and workers > 0:
+        ingestion_workers = IngestionWorkers(ingestion_queue, handler, success, workers, INGESTION_POLL_INTERVAL)
+        ingestion_workers.start()
+    return ingestion_workers
+
+def enqueue_ingestion(brainName, files):
+    """
+    Queue an upload and wake this process' workers.
+
+    Args:
+        brainName (str): The name of the brain.
+        files (list): The uploaded files.
+
+    Returns:
+        str: The id of the job.
+    """
+    job_id = ingestion_queue.enqueue(brainName, files)
+    if ingestion_workers is not None:
+        ingestion_workers.notify()
+    return job_id
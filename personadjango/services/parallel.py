@@ -0,0 +1,251 @@
+import os
+import time
+import logging
+from threading import Lock
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from dotenv import load_dotenv
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, file locks then only hold within the process
+    fcntl = None
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Run the independent pre-answer stages (language detection, manipulation analysis,
+# summarization) concurrently unless explicitly disabled for the deployment
+PARALLEL_STAGES_ENABLED = os.environ.get('CHAT_PARALLEL_STAGES', 'True').lower() in ['true']
+
+# Shared pool for chat stages, sized for a few concurrent stages per in-flight request
+stage_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('CHAT_PARALLEL_WORKERS', 16)),
+    thread_name_prefix='chat-stage'
+)
+
+def run_timed_stage(brainName, stage_name, func, *args, **kwargs):
+    """
+    Run a single chat stage and log how long it took.
+
+    Args:
+        brainName (str): The name of the brain the stage runs for.
+        stage_name (str): A short label for the stage used in the timing log.
+        func (callable): The function implementing the stage.
+        *args: Positional arguments passed to func.
+        **kwargs: Keyword arguments passed to func.
+
+    Returns:
+        Any: The value returned by func.
+    """
+    start_time = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        logging.info(f"For BrainID - {brainName}, Stage '{stage_name}' took {elapsed_ms:.1f} ms")
+
+def submit_stage(brainName, stage_name, func, *args, **kwargs):
+    """
+    Start a chat stage on the shared thread pool and return a future for its result.
+
+    When parallel stages are disabled the stage runs inline and an already completed
+    future is returned, so callers can treat both modes the same way.
+
+    Args:
+        brainName (str): The name of the brain the stage runs for.
+        stage_name (str): A short label for the stage used in the timing log.
+        func (callable): The function implementing the stage.
+        *args: Positional arguments passed to func.
+        **kwargs: Keyword arguments passed to func.
+
+    Returns:
+        Future: A future resolving to the value returned by func.
+    """
+    if PARALLEL_STAGES_ENABLED:
+        return stage_executor.submit(run_timed_stage, brainName, stage_name, func, *args, **kwargs)
+
+    future = Future()
+    try:
+        future.set_result(run_timed_stage(brainName, stage_name, func, *args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def completed_stage(value):
+    """
+    Wrap a ready value in a completed future, for stages that are skipped.
+
+    Args:
+        value (Any): The value the future should resolve to.
+
+    Returns:
+        Future: A completed future holding value.
+    """
+    future = Future()
+    future.set_result(value)
+    return future
+
+def timed_stream(brainName, stage_name, iterator):
+    """
+    Pass a streamed stage through unchanged while logging time to first piece and total time.
+
+    Args:
+        brainName (str): The name of the brain the stage runs for.
+        stage_name (str): A short label for the stage used in the timing log.
+        iterator (iterator): The streamed stage output.
+
+    Yields:
+        Any: The items produced by iterator.
+    """
+    start_time = time.perf_counter()
+    first_piece = True
+    try:
+        for item in iterator:
+            if first_piece:
+                first_piece = False
+                elapsed_ms = (time.perf_counter() - start_time) * 1000
+                logging.info(f"For BrainID - {brainName}, Stage '{stage_name}' first piece after {elapsed_ms:.1f} ms")
+            yield item
+    finally:
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        logging.info(f"For BrainID - {brainName}, Stage '{stage_name}' took {elapsed_ms:.1f} ms")
+
+async def run_timed_stage_async(brainName, stage_name, awaitable):
+    """
+    Await a single chat stage and log how long it took.
+
+    Args:
+        brainName (str): The name of the brain the stage runs for.
+        stage_name (str): A short label for the stage used in the timing log.
+        awaitable (Awaitable): The coroutine implementing the stage.
+
+    Returns:
+        Any: The value the awaitable resolves to.
+    """
+    start_time = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        logging.info(f"For BrainID - {brainName}, Stage '{stage_name}' took {elapsed_ms:.1f} ms")
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Hold an exclusive lock on a lock file, shared with the other processes of the node.
+
+    Every call opens the file anew, so threads of the same process exclude each other too.
+
+    Args:
+        path (str): The lock file, created if missing.
+        blocking (bool, optional): Wait for the lock, or give up at once if another holder has it.
+
+    Yields:
+        bool: True if the lock is held, False if blocking is off and the lock was taken.
+    """
+    with open(path, 'a') as lock_file:
+        if fcntl is None:
+            yield True
+            return
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers arriving while a call for the same key
+    is in flight wait for it and share its result, or its exception, instead of repeating it.
+
+    Counters of calls, coalesced waits and call durations are kept for monitoring.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.flights = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def run(self, key, func, *args, **kwargs):
+        """
+        Call func for key, or wait for the call already in flight for key.
+
+        Args:
+            key (str): The key calls are coalesced on.
+            func (callable): The function to call.
+            *args: Positional arguments passed to func.
+            **kwargs: Keyword arguments passed to func.
+
+        Returns:
+            Any: The value returned by the call.
+        """
+        with self.lock:
+            future = self.flights.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.flights[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            logging.info(f"Waiting for the call in flight for '{key}'")
+            return future.result()
+
+        start_time = time.perf_counter()
+        failed = False
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # Waiters must be released whatever happened to the call
+            failed = True
+            future.set_exception(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start_time
+            with self.lock:
+                del self.flights[key]
+                self.calls += 1
+                self.failures += failed
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+                self.last_seconds = elapsed
+                coalesced = self.coalesced
+            logging.info(f"Call for '{key}' {'failed' if failed else 'finished'} after {elapsed:.2f} s, {coalesced} coalesced waits so far")
+
+    def in_flight(self):
+        """
+        Return the keys of the calls currently running.
+        """
+        with self.lock:
+            return list(self.flights)
+
+    def stats(self):
+        """
+        Report the calls made, the waits they saved and how long they took.
+
+        Returns:
+            dict: Call, coalesced wait and failure counts, calls in flight and durations in seconds.
+        """
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'coalesced_waits': self.coalesced,
+                'failures': self.failures,
+                'in_flight': len(self.flights),
+                'total_seconds': self.total_seconds,
+                'avg_seconds': (self.total_seconds / self.calls) if self.calls else 0.0,
+                'max_seconds': self.max_seconds,
+                'last_seconds': self.last_seconds,
+            }
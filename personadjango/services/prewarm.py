@@ -0,0 +1,175 @@
+import os
+import logging
+from threading import Lock, Thread
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from personadjango.services.brains import (
+                                brain_loads,
+                                load_brain
+                                )
+from personadjango.services.brain_cache import (
+                                brain_cache
+                                )
+from personadjango.services.brain_usage import (
+                                brain_usage
+                                )
+from personadjango.services.index_cache import (
+                                index_disk_cache
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Brains loaded at startup: a fixed list plus the most used brains of the recent history
+PREWARM_ON_STARTUP = os.environ.get('PREWARM_ON_STARTUP', 'False').lower() in ['true']
+PREWARM_BRAINS = [name.strip() for name in os.environ.get('PREWARM_BRAINS', '').split(',') if name.strip()]
+PREWARM_TOP_BRAINS = int(os.environ.get('PREWARM_TOP_BRAINS', 0))
+PREWARM_HISTORY_DAYS = int(os.environ.get('PREWARM_HISTORY_DAYS', 7))
+PREWARM_WORKERS = int(os.environ.get('PREWARM_WORKERS', 4))
+
+class PrewarmState:
+    """
+    Progress of the startup prewarm, reported by the readiness endpoint.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.running = False
+        self.pending = []
+        self.warm = []
+        self.failed = {}
+
+    def start(self, brainNames):
+        with self.lock:
+            self.running = True
+            self.pending = list(brainNames)
+            self.warm = []
+            self.failed = {}
+
+    def finish_brain(self, brainName, error=None):
+        with self.lock:
+            if brainName in self.pending:
+                self.pending.remove(brainName)
+            if error is None:
+                self.warm.append(brainName)
+            else:
+                self.failed[brainName] = error
+
+    def finish(self):
+        with self.lock:
+            self.running = False
+
+    def snapshot(self):
+        with self.lock:
+            return {'running': self.running, 'pending': list(self.pending), 'warm': list(self.warm), 'failed': dict(self.failed)}
+
+prewarm_state = PrewarmState()
+
+def prewarm_brain_names(brainNames=None, top=PREWARM_TOP_BRAINS):
+    """
+    Decide which brains to prewarm.
+
+    Args:
+        brainNames (list, optional): Brains to prewarm, PREWARM_BRAINS when omitted.
+        top (int, optional): Also prewarm this many of the most used brains of the recent history.
+
+    Returns:
+        list: The brain names, without duplicates, in the order given.
+    """
+    names = list(PREWARM_BRAINS if brainNames is None else brainNames)
+    if top > 0:
+        names += brain_usage.most_used(top, PREWARM_HISTORY_DAYS * 86400)
+    return list(dict.fromkeys(names))
+
+def warm_brain(brainName):
+    """
+    Load one brain into the brain cache.
+
+    Args:
+        brainName (str): The name of the brain.
+
+    Returns:
+        str: None if the brain is warm, otherwise the reason it could not be loaded.
+    """
+    try:
+        response, _ = load_brain(brainName, record_usage=False)
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName}, Prewarm failed: {e}")
+        return str(e)
+    if response is not None:
+        logging.error(f"For BrainID - {brainName}, Prewarm failed with status {response.status_code}")
+        return response.content.decode()
+    logging.info(f"For BrainID - {brainName}, Prewarmed")
+    return None
+
+def warm_brain_on_disk(brainName):
+    """
+    Fetch one brain index into the disk cache without loading it, for prewarming from
+    another process than the server workers.
+
+    Args:
+        brainName (str): The name of the brain.
+
+    Returns:
+        str: None if the index is on disk, otherwise the reason it could not be fetched.
+    """
+    try:
+        index_disk_cache.fetch(brainName)
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName}, Prewarm on disk failed: {e}")
+        return str(e)
+    logging.info(f"For BrainID - {brainName}, Index prewarmed on disk")
+    return None
+
+def prewarm_brains(brainNames, workers=PREWARM_WORKERS, warm=warm_brain):
+    """
+    Warm several brains in parallel.
+
+    Args:
+        brainNames (list): The brains to warm.
+        workers (int, optional): How many brains are loaded at the same time.
+        warm (callable, optional): The function warming one brain, returning None or an error.
+
+    Returns:
+        dict: The brains that could not be warmed, mapped to the reason.
+    """
+    prewarm_state.start(brainNames)
+    failed = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='prewarm') as executor:
+            for brainName, error in zip(brainNames, executor.map(warm, brainNames)):
+                prewarm_state.finish_brain(brainName, error)
+                if error is not None:
+                    failed[brainName] = error
+    finally:
+        prewarm_state.finish()
+    logging.info(f"Prewarmed {len(brainNames) - len(failed)} of {len(brainNames)} brains")
+    return failed
+
+def start_prewarm():
+    """
+    Prewarm the configured brains in a background thread, the readiness endpoint reports
+    the worker as not ready until it is done.
+    """
+    brainNames = prewarm_brain_names()
+    if not brainNames:
+        return
+    logging.info(f"Prewarming brains at startup: {brainNames}")
+    prewarm_state.start(brainNames)
+    Thread(target=prewarm_brains, args=(brainNames,), name='prewarm', daemon=True).start()
+
+def readiness():
+    """
+    Report whether this worker finished prewarming and which brains are in memory.
+
+    Returns:
+        dict: 'ready' (bool), the 'warm' brains in memory, the brains still 'loading'
+              and the prewarm 'failed' brains with the reason.
+    """
+    state = prewarm_state.snapshot()
+    loading = list(dict.fromkeys(state['pending'] + brain_loads.in_flight()))
+    return {
+        'ready': not state['running'],
+        'warm': brain_cache.names(),
+        'loading': loading,
+        'failed': state['failed'],
+    }
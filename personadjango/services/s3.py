@@ -1,4 +1,5 @@
 import os
+import json
 import boto3
 import logging
 from dotenv import load_dotenv
@@ -7,7 +8,11 @@ from django.http import JsonResponse
 # Load environment variables from a .env file
 load_dotenv()
 
-MASTER_EMBEDDING_ARRAY = {}
+def segment_index_repo():
+    """
+    Return the S3 folder holding the delta segments of the brain indexes, next to S3_MASTER_INDEX_REPO.
+    """
+    return os.environ.get('S3_SEGMENT_INDEX_REPO') or f"{os.environ.get('S3_MASTER_INDEX_REPO')}_segments"
 
 def upload_folder_to_s3(bucket, local_folder, to_s3_index_folder):
     """
@@ -156,6 +161,50 @@ def download_files_from_s3(bucket, folder, local_path):
         logging.error(f'Error downloading files from S3: {e}')
         raise
 
+def list_s3_folder_files(bucket, folder):
+    """
+    List the files in a specific folder of the S3 bucket with their ETag and size.
+
+    Args:
+        bucket (str): The name of the S3 bucket.
+        folder (str): The folder path in the S3 bucket.
+
+    Returns:
+        dict: The file keys mapped to {'etag': str, 'size': int}.
+    """
+    logging.info(f'Listing files in S3 bucket {bucket} folder {folder}')
+    try:
+        s3_client = boto3.client('s3', aws_access_key_id=os.environ.get('ACCESS_KEY'), aws_secret_access_key=os.environ.get('SECRET_KEY'))
+        response = s3_client.list_objects_v2(Bucket=bucket, Prefix=folder)
+        return {
+            obj['Key']: {'etag': obj['ETag'].strip('"'), 'size': obj['Size']}
+            for obj in response.get('Contents', [])
+            if not obj['Key'].endswith('/')
+        }
+    except Exception as e:
+        logging.error(f'Error listing files in S3 folder {folder}: {e}')
+        raise
+
+def download_s3_files(bucket, keys, local_path):
+    """
+    Download specific files from the S3 bucket to a local directory.
+
+    Args:
+        bucket (str): The name of the S3 bucket.
+        keys (list): The keys of the files to download.
+        local_path (str): The local directory to save the downloaded files.
+    """
+    logging.info(f'Downloading {len(keys)} files from S3 bucket {bucket} to local path {local_path}')
+    try:
+        s3_client = boto3.client('s3', aws_access_key_id=os.environ.get('ACCESS_KEY'), aws_secret_access_key=os.environ.get('SECRET_KEY'))
+        for key in keys:
+            local_file_path = os.path.join(local_path, os.path.basename(key))
+            s3_client.download_file(bucket, key, local_file_path)
+            logging.info(f'Downloaded s3://{bucket}/{key} to {local_file_path}')
+    except Exception as e:
+        logging.error(f'Error downloading files from S3: {e}')
+        raise
+
 def upload_content_from_fileindexrange_to_s3(brainName):
     """
     Upload the content of the file index range to the S3 bucket.
@@ -175,6 +224,40 @@ def upload_content_from_fileindexrange_to_s3(brainName):
             logging.error(f'Failed to upload {json_file_path}: {e}')
             logging.error(f"Failed to upload {json_file_path}:{str(e)}")
 
+def read_index_metadata_from_s3(brainName):
+    """
+    Read the brain metadata uploaded next to the index by upload_content_from_fileindexrange_to_s3.
+
+    Args:
+        brainName (str): The name of the brain.
+
+    Returns:
+        dict: The brain metadata, or None if the brain has no metadata in S3.
+    """
+    s3_key = os.path.join(os.environ.get('S3_MASTER_INDEX_REPO'), f"{brainName}/{brainName}.json")
+    s3 = boto3.client('s3', aws_access_key_id=os.environ.get('ACCESS_KEY'), aws_secret_access_key=os.environ.get('SECRET_KEY'))
+    try:
+        response = s3.get_object(Bucket=os.environ.get('BUCKET_NAME'), Key=s3_key)
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read())
+
+def delete_s3_folder(bucket, folder):
+    """
+    Delete every object under a folder of the S3 bucket.
+
+    Args:
+        bucket (str): The name of the S3 bucket.
+        folder (str): The folder path in the S3 bucket.
+    """
+    logging.info(f'Deleting S3 folder {folder} from bucket {bucket}')
+    try:
+        s3 = boto3.resource('s3', aws_access_key_id=os.environ.get('ACCESS_KEY'), aws_secret_access_key=os.environ.get('SECRET_KEY'))
+        s3.Bucket(bucket).objects.filter(Prefix=f"{folder.rstrip('/')}/").delete()
+    except Exception as e:
+        logging.error(f'Error deleting S3 folder {folder}: {e}')
+        raise
+
 def delete_folder_from_s3(brainName):
     """
     Delete a folder and its contents from the S3 bucket.
@@ -190,6 +273,7 @@ def delete_folder_from_s3(brainName):
         folder_prefix_index = f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}/"
         bucket.objects.filter(Prefix=folder_prefix).delete()
         bucket.objects.filter(Prefix=folder_prefix_index).delete()
+        bucket.objects.filter(Prefix=f"{segment_index_repo()}/{brainName}/").delete()
         logging.info(f'Folder for brain {brainName} deleted from S3')
     except Exception as e:
         logging.error(f'Error deleting folder for brain {brainName} from S3: {e}')
@@ -261,6 +345,9 @@ def rename_s3_brain_folders(old_brainName, new_brainName):
     # Rename folder in S3 master_index_repo
     rename_s3_folder(f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{old_brainName}/", f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{new_brainName}/")
 
+    # Rename the delta segments of a segmented index
+    rename_s3_folder(f"{segment_index_repo()}/{old_brainName}/", f"{segment_index_repo()}/{new_brainName}/")
+
 # Additional rules for prompt content handling
 # 8. Every Prompt Content passed is preceded with "FileName - >", if you found information for answer from those particular Prompt , at the end of answer return FileName in '[]'.
 # 8. convert numbers representing years or monetary amounts into words. For example, 250000 should be written as "two hundred fifty thousand." Dates of birth should be represented in date month_name year format.
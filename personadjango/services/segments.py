@@ -0,0 +1,374 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+from threading import Lock
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from personadjango.services.s3 import (
+                                segment_index_repo,
+                                upload_folder_to_s3,
+                                download_files_from_s3,
+                                delete_s3_folder,
+                                upload_content_from_fileindexrange_to_s3
+                                )
+from personadjango.services.index import (
+                                read_file_index_ranges,
+                                save_file_index_ranges,
+                                bump_index_version
+                                )
+from personadjango.services.index_cache import (
+                                INDEX_DISK_CACHE_ENABLED,
+                                index_disk_cache
+                                )
+from personadjango.services.brain_cache import (
+                                folder_size
+                                )
+from personadjango.services.embedding_models import (
+                                embedding_models
+                                )
+from personadjango.services.parallel import (
+                                file_lock
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Uploads add delta segments and deletes add tombstones, instead of rewriting the whole brain index
+SEGMENTED_INDEX = os.environ.get('SEGMENTED_INDEX', 'False').lower() in ['true']
+# A brain is compacted once it has this many segments, tombstoned ids or a segment this old in seconds
+SEGMENT_COMPACT_MAX_DELTAS = int(os.environ.get('SEGMENT_COMPACT_MAX_DELTAS', 8))
+SEGMENT_COMPACT_MAX_TOMBSTONES = int(os.environ.get('SEGMENT_COMPACT_MAX_TOMBSTONES', 10000))
+SEGMENT_COMPACT_MAX_AGE = int(os.environ.get('SEGMENT_COMPACT_MAX_AGE', 86400))
+# Documents folded from the segments into the base index per upsert
+SEGMENT_COMPACT_BATCH_SIZE = int(os.environ.get('UPSERT_BATCH_SIZE', 64))
+
+# Metadata writes of the same brain are serialized within the process, and through a lock file
+# next to the metadata with the other processes of the node, e.g. run_ingestion_workers
+write_locks = {}
+write_locks_lock = Lock()
+
+# Compactions run one at a time per process, in the background, and one per brain on the node
+compactions = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compaction')
+pending_compactions = set()
+pending_compactions_lock = Lock()
+
+def brain_lock_path(brainName, purpose):
+    """
+    Return the lock file of a brain, kept next to its metadata file.
+    """
+    return f"{os.environ.get('FILE_INDEX_RANGE')}/{brainName}.{purpose}.lock"
+
+@contextmanager
+def segment_write_lock(brainName):
+    """
+    Serialize the metadata read-modify-writes of a brain, across the threads and processes of the node.
+
+    Args:
+        brainName (str): The name of the brain.
+    """
+    with write_locks_lock:
+        if brainName not in write_locks:
+            write_locks[brainName] = Lock()
+        lock = write_locks[brainName]
+    with lock, file_lock(brain_lock_path(brainName, 'write')):
+        yield
+
+def segment_s3_folder(brainName, segment_id):
+    """
+    Return the S3 folder of a delta segment.
+    """
+    return f"{segment_index_repo()}/{brainName}/{segment_id}"
+
+def new_segment_id():
+    """
+    Return a unique id for a new delta segment, ordered by creation time.
+    """
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+def tombstoned_ids(metadata):
+    """
+    Count the ids deleted from a brain but still present in its index files.
+    """
+    return sum(end - start + 1 for start, end in metadata.get('tombstones', []))
+
+class SegmentedIndex:
+    """
+    A brain's base index and its delta segments, searched as one index.
+
+    Every segment is searched and the hits are merged by score. Hits of ids that no file
+    owns anymore, the tombstoned ones, are dropped, so a segment is searched again with a
+    larger limit until it returns enough live hits or has no more.
+
+    Args:
+        base (Embeddings): The base index.
+        deltas (list): The delta segment indexes, oldest first.
+        file_ranges (FileRanges): The file index ranges of the brain, deleted files excluded.
+    """
+    def __init__(self, base, deltas, file_ranges):
+        self.base = base
+        self.deltas = deltas
+        self.file_ranges = file_ranges
+
+    @property
+    def config(self):
+        return self.base.config
+
+    def count(self):
+        return sum(index.count() for index in [self.base] + self.deltas)
+
+    def transform(self, text):
+        return self.base.transform(text)
+
+    def search(self, query, limit):
+        """
+        Search the base index and every delta segment.
+
+        Args:
+            query (str): The search query.
+            limit (int): The number of results to return.
+
+        Returns:
+            list: The best hits of all segments, as returned by Embeddings.search.
+        """
+        hits = {}
+        for index in [self.base] + self.deltas:
+            for hit in self.live_hits(index, query, limit):
+                key = int(hit['id'])
+                # An id may be in two segments for a moment while a compaction is published
+                if key not in hits or hit['score'] > hits[key]['score']:
+                    hits[key] = hit
+        return sorted(hits.values(), key=lambda hit: hit['score'], reverse=True)[:limit]
+
+    def live_hits(self, index, query, limit):
+        """
+        Search one index for limit hits of ids a file still owns, skipping the tombstoned ones.
+
+        Args:
+            index (Embeddings): The base index or a delta segment.
+            query (str): The search query.
+            limit (int): The number of live hits wanted.
+
+        Returns:
+            list: Up to limit live hits, fewer only if the index has no more.
+        """
+        fetch = limit * 2
+        while True:
+            results = index.search(query, fetch)
+            live = [hit for hit in results if self.file_ranges.file_name(int(hit['id'])) is not None]
+            if len(live) >= limit or len(results) < fetch:
+                return live[:limit]
+            # After a large delete most top hits can be tombstoned, look further down
+            fetch *= 4
+
+    def close(self):
+        for index in [self.base] + self.deltas:
+            index.close()
+
+def load_segments(brainName, segment_ids):
+    """
+    Load the delta segments of a brain.
+
+    Args:
+        brainName (str): The name of the brain.
+        segment_ids (list): The segments listed in the brain's metadata, oldest first.
+
+    Returns:
+        tuple: (list of loaded Embeddings, int size of their files in bytes).
+    """
+    deltas, size = [], 0
+    for segment_id in segment_ids:
+        if INDEX_DISK_CACHE_ENABLED:
+            segment_folder, temp_folder = index_disk_cache.fetch_segment(brainName, segment_id), None
+        else:
+            segment_folder = temp_folder = f"{os.environ.get('TEMP_CONNECTION_INDEX_STORAGE')}/{brainName}-{segment_id}/"
+            os.makedirs(temp_folder, exist_ok=True)
+            download_files_from_s3(os.environ.get('BUCKET_NAME'), f"{segment_s3_folder(brainName, segment_id)}/", temp_folder)
+        try:
+            delta = embedding_models.embeddings(hybrid=True, content=True)
+            delta.load(segment_folder)
+            deltas.append(delta)
+            size += folder_size(segment_folder)
+        finally:
+            if temp_folder:
+                shutil.rmtree(temp_folder, ignore_errors=True)
+    if INDEX_DISK_CACHE_ENABLED:
+        index_disk_cache.remove_other_segments(brainName, segment_ids)
+    logging.info(f"For BrainID - {brainName}, Loaded {len(deltas)} Index Segments ({size} bytes)")
+    return deltas, size
+
+def add_delta_segment(brainName, segment_path, first_index, last_index):
+    """
+    Upload a saved delta index as a new segment of a brain.
+
+    Args:
+        brainName (str): The name of the brain.
+        segment_path (str): The folder the delta index was saved to.
+        first_index (int): The first id of the segment.
+        last_index (int): The last id of the segment.
+
+    Returns:
+        dict: The segment entry to add to the brain metadata's 'segments'.
+    """
+    segment_id = new_segment_id()
+    upload_folder_to_s3(os.environ.get('BUCKET_NAME'), segment_path, segment_s3_folder(brainName, segment_id))
+    logging.info(f"For BrainID - {brainName}, Index segment {segment_id} uploaded with ids {first_index} to {last_index}")
+    return {'id': segment_id, 'first': first_index, 'last': last_index, 'created': time.time()}
+
+def tombstone_files(brainName, file_names):
+    """
+    Delete files from a segmented brain by recording their id ranges as tombstones.
+
+    The index files are left untouched, searches skip the ids and compaction removes them.
+    The index version is bumped in the same locked update.
+
+    Args:
+        brainName (str): The name of the brain.
+        file_names (list): The files to delete, files the brain does not have are ignored.
+
+    Returns:
+        tuple: (list of deleted file names, int number of ids tombstoned).
+    """
+    with segment_write_lock(brainName):
+        metadata = read_file_index_ranges(brainName)
+        files = metadata.get('files', {})
+        deleted = [file_name for file_name in dict.fromkeys(file_names) if file_name in files]
+        ranges = [files.pop(file_name) for file_name in deleted]
+        if ranges:
+            metadata.setdefault('tombstones', []).extend(ranges)
+            save_file_index_ranges(brainName, metadata)
+            bump_index_version(brainName)
+    count = sum(end - start + 1 for start, end in ranges)
+    logging.info(f"For BrainID - {brainName}, Tombstoned {count} ids of {len(deleted)} files")
+    return deleted, count
+
+def compaction_due(metadata):
+    """
+    Decide whether a brain's segments and tombstones should be folded into its base index.
+
+    Args:
+        metadata (dict): The brain metadata.
+
+    Returns:
+        bool: True if a size or age threshold is reached.
+    """
+    segments = metadata.get('segments', [])
+    if len(segments) >= SEGMENT_COMPACT_MAX_DELTAS or tombstoned_ids(metadata) >= SEGMENT_COMPACT_MAX_TOMBSTONES:
+        return True
+    return bool(segments) and time.time() - min(segment['created'] for segment in segments) >= SEGMENT_COMPACT_MAX_AGE
+
+def compact_brain(brainName):
+    """
+    Fold the delta segments of a brain into its base index and apply its tombstones.
+
+    At most one process of the node compacts a brain at a time, the others skip it.
+
+    The new base is uploaded before the metadata drops the folded segments, so a worker
+    loading in between sees some ids twice, which searches tolerate, but never misses one.
+    Segments and tombstones added while the compaction runs are kept for the next one.
+
+    Args:
+        brainName (str): The name of the brain.
+
+    Returns:
+        bool: True if something was compacted, False if the brain had no segments or tombstones
+              or another process is compacting it.
+    """
+    with file_lock(brain_lock_path(brainName, 'compaction'), blocking=False) as locked:
+        if not locked:
+            logging.info(f"For BrainID - {brainName}, Compaction already running in another process, skipped")
+            return False
+        return compact_locked_brain(brainName)
+
+def compact_locked_brain(brainName):
+    """
+    Compact a brain while holding its compaction lock, see compact_brain.
+    """
+    metadata = read_file_index_ranges(brainName)
+    segments = list(metadata.get('segments', []))
+    tombstones = [list(tombstone) for tombstone in metadata.get('tombstones', [])]
+    if not segments and not tombstones:
+        return False
+
+    start_time = time.perf_counter()
+    bucket = os.environ.get('BUCKET_NAME')
+    work_folder = f"{os.environ.get('TEMP_INDEX_STORAGE')}/{brainName}-compaction-{os.getpid()}"
+    base_path = os.path.join(work_folder, 'base')
+    os.makedirs(base_path, exist_ok=True)
+    try:
+        download_files_from_s3(bucket, f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}/", base_path)
+        base = embedding_models.embeddings(hybrid=True, content=True)
+        base.load(base_path)
+
+        for segment in segments:
+            segment_path = os.path.join(work_folder, segment['id'])
+            os.makedirs(segment_path, exist_ok=True)
+            download_files_from_s3(bucket, f"{segment_s3_folder(brainName, segment['id'])}/", segment_path)
+            delta = embedding_models.embeddings(hybrid=True, content=True)
+            delta.load(segment_path)
+            rows = delta.search("select id, text, tags from txtai", delta.count())
+            for position in range(0, len(rows), SEGMENT_COMPACT_BATCH_SIZE):
+                base.upsert([(int(row['id']), row['text'], row['tags']) for row in rows[position:position + SEGMENT_COMPACT_BATCH_SIZE]])
+            delta.close()
+
+        ids = [i for start, end in tombstones for i in range(start, end + 1)]
+        if ids:
+            base.delete(ids)
+        base.save(base_path)
+        base.close()
+        # The metadata file of the brain shares the S3 folder, the current one is uploaded below
+        metadata_copy = os.path.join(base_path, f"{brainName}.json")
+        if os.path.exists(metadata_copy):
+            os.remove(metadata_copy)
+        upload_folder_to_s3(bucket, base_path, f"{os.environ.get('S3_MASTER_INDEX_REPO')}/{brainName}")
+
+        compacted = {segment['id'] for segment in segments}
+        with segment_write_lock(brainName):
+            metadata = read_file_index_ranges(brainName)
+            metadata['segments'] = [segment for segment in metadata.get('segments', []) if segment['id'] not in compacted]
+            metadata['tombstones'] = [tombstone for tombstone in metadata.get('tombstones', []) if list(tombstone) not in tombstones]
+            save_file_index_ranges(brainName, metadata)
+            bump_index_version(brainName)
+        upload_content_from_fileindexrange_to_s3(brainName)
+
+        for segment_id in compacted:
+            delete_s3_folder(bucket, segment_s3_folder(brainName, segment_id))
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    logging.info(f"For BrainID - {brainName}, Compacted {len(segments)} segments and {len(ids)} tombstoned ids in {time.perf_counter() - start_time:.1f} s")
+    return True
+
+def run_compaction(brainName):
+    """
+    Compact a brain, run by schedule_compaction.
+    """
+    try:
+        compact_brain(brainName)
+    except Exception as e:
+        logging.error(f"For BrainID - {brainName}, Compaction failed: {e}")
+    finally:
+        with pending_compactions_lock:
+            pending_compactions.discard(brainName)
+
+def schedule_compaction(brainName):
+    """
+    Compact a brain in the background if a threshold is reached, at most once at a time per brain.
+
+    Args:
+        brainName (str): The name of the brain, after its segments or tombstones changed.
+
+    Returns:
+        bool: True if a compaction was scheduled.
+    """
+    if not compaction_due(read_file_index_ranges(brainName)):
+        return False
+    with pending_compactions_lock:
+        if brainName in pending_compactions:
+            return False
+        pending_compactions.add(brainName)
+    logging.info(f"For BrainID - {brainName}, Compaction scheduled")
+    compactions.submit(run_compaction, brainName)
+    return True
@@ -0,0 +1,184 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+from threading import Lock
+from collections import OrderedDict
+from dotenv import load_dotenv
+from personadjango.helper.summarize import (
+                                condense_previous_qa_safely
+                                )
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# 'memory' keeps sessions in this process, 'redis' shares them through a Redis-compatible server
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'memory').lower()
+SESSION_STORE_SIZE = int(os.environ.get('SESSION_STORE_SIZE', 4096))
+SESSION_TTL = int(os.environ.get('SESSION_TTL', 86400))
+SESSION_REDIS_URL = os.environ.get('SESSION_REDIS_URL', 'redis://localhost:6379/0')
+
+# Session ids are generated with uuid4().hex, anything else sent by a client is replaced
+SESSION_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+class MemorySessionStore:
+    """
+    In-process session store with LRU and TTL eviction.
+
+    Args:
+        max_entries (int): Maximum number of conversations kept.
+        ttl (int): Seconds a conversation stays valid after its last turn.
+    """
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sessions = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, session_id):
+        """
+        Return the stored session, or None if it is unknown or expired.
+        """
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.time():
+                del self.sessions[session_id]
+                return None
+            self.sessions.move_to_end(session_id)
+            return entry['session']
+
+    def set(self, session_id, session):
+        """
+        Store a session, evicting the least recently used one when the store is full.
+        """
+        with self.lock:
+            self.sessions[session_id] = {'session': session, 'expires_at': time.time() + self.ttl}
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_entries:
+                self.sessions.popitem(last=False)
+
+class RedisSessionStore:
+    """
+    Session store backed by a Redis-compatible server, shared by every worker process.
+
+    Args:
+        url (str): The server URL, e.g. redis://localhost:6379/0.
+        ttl (int): Seconds a conversation stays valid after its last turn.
+    """
+    key_prefix = 'personadjango:session:'
+
+    def __init__(self, url, ttl):
+        # Only needed for this backend, so it is not part of requirements.txt
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, session_id):
+        """
+        Return the stored session, or None if it is unknown or expired.
+        """
+        raw = self.client.get(self.key_prefix + session_id)
+        return json.loads(raw) if raw else None
+
+    def set(self, session_id, session):
+        """
+        Store a session, the server expires it after the TTL.
+        """
+        self.client.set(self.key_prefix + session_id, json.dumps(session), ex=self.ttl)
+
+def build_session_store():
+    """
+    Create the session store selected by SESSION_BACKEND.
+
+    Returns:
+        MemorySessionStore | RedisSessionStore: The configured store.
+    """
+    if SESSION_BACKEND == 'redis':
+        logging.info(f"Conversation sessions stored in Redis at {SESSION_REDIS_URL}")
+        return RedisSessionStore(SESSION_REDIS_URL, SESSION_TTL)
+    return MemorySessionStore(SESSION_STORE_SIZE, SESSION_TTL)
+
+session_store = build_session_store()
+
+def open_session(session_id, brainName):
+    """
+    Resolve the conversation a request belongs to.
+
+    Args:
+        session_id (str): The session id sent by the client, may be None.
+        brainName (str): The name of the brain the question is asked to.
+
+    Returns:
+        tuple: (str, str) with the session id to return to the client and the condensed
+               context of the conversation so far, empty for a new conversation.
+    """
+    if not session_id or not SESSION_ID_PATTERN.match(session_id):
+        return uuid.uuid4().hex, ""
+    try:
+        session = session_store.get(session_id)
+    except Exception as e:
+        logging.warning(f"For BrainID - {brainName}, Failed to read session {session_id}: {e}")
+        session = None
+    if session is None or session.get('brainName') != brainName:
+        return session_id, ""
+    logging.info(f"For BrainID - {brainName}, Continuing session {session_id}")
+    return session_id, session.get('context', "")
+
+def save_session_turn(session_id, brainName, context):
+    """
+    Write the rolled conversation context, a failing store only loses the history.
+    """
+    try:
+        session_store.set(session_id, {'brainName': brainName, 'context': context})
+    except Exception as e:
+        logging.warning(f"For BrainID - {brainName}, Failed to save session {session_id}: {e}")
+
+def record_session_turn(session_id, brainName, conversation_context, question, payload):
+    """
+    Fold the answered turn into the conversation context and add the session id to the payload.
+
+    Only the previous condensed context and the new turn are condensed, so the work per turn
+    does not grow with the length of the conversation. The context is always condensed
+    locally, even with CHAT_LLM_SUMMARY, so no LLM call stands between the answer and the client.
+
+    Args:
+        session_id (str): The session id returned by open_session.
+        brainName (str): The name of the brain.
+        conversation_context (str): The condensed context the question was answered with.
+        question (str): The question asked by the user.
+        payload (dict): The payload returned to the client.
+
+    Returns:
+        dict: A copy of the payload with its 'session_id'.
+    """
+    context = condense_previous_qa_safely(question, f"{conversation_context} {payload['answer']}".strip())
+    save_session_turn(session_id, brainName, context)
+    return {**payload, 'session_id': session_id}
+
+async def async_record_session_turn(session_id, brainName, conversation_context, question, payload):
+    """
+    Async version of record_session_turn.
+    """
+    return await asyncio.to_thread(record_session_turn, session_id, brainName, conversation_context, question, payload)
+
+def session_events(events, context):
+    """
+    Pass answer events through, recording the turn in the session when the answer is done.
+
+    Args:
+        events (iterator): The (event, value) pairs of an answer.
+        context (dict): The chat context, with 'session_id', 'brainName',
+                        'conversation_context' and 'question_asked'.
+
+    Yields:
+        tuple: The same events, the 'done' payload carrying the session id.
+    """
+    for event, value in events:
+        if event == 'done':
+            value = record_session_turn(context['session_id'], context['brainName'], context['conversation_context'], context['question_asked'], value)
+        yield event, value
@@ -22,8 +22,6 @@ ENVIRONMENT = os.getenv('DJANGO_ENVIRONMENT', 'production')  # Default to produc
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-MASTER_EMBEDDING_ARRAY = {}
-
 load_dotenv()
 
 # Quick-start development settings - unsuitable for production
@@ -11,6 +11,9 @@ from personadjango.services.index import (
     rename_local_index_file
 )
 from personadjango.services.openai import send_error, send_response
+from personadjango.services.answer_cache import invalidate_cached_answers
+from personadjango.services.index_cache import index_disk_cache
+from personadjango.services.index_versions import remote_metadata
 
 @csrf_exempt
 def renamebrain(request):
@@ -56,6 +59,12 @@ def renamebrain(request):
 
         logging.info(f'Brain {old_brainName} successfully renamed to {new_brainName}')
 
+        invalidate_cached_answers(old_brainName)
+        invalidate_cached_answers(new_brainName)
+        index_disk_cache.evict(old_brainName)
+        remote_metadata.invalidate(old_brainName)
+        remote_metadata.invalidate(new_brainName)
+
     except Exception as e:
         logging.error(f'Error renaming brain: {e}')
         return send_error(data=[str(e)], message="Failed to rename brain", status=500)
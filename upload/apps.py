@@ -1,6 +1,16 @@
+import sys
 from django.apps import AppConfig
 
 
 class UploadConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'upload'
+
+    def ready(self):
+        # Ingestion workers run in the server processes only, not for migrate or other management commands
+        if len(sys.argv) > 1 and sys.argv[0].endswith('manage.py') and sys.argv[1] != 'runserver':
+            return
+        from personadjango.services.ingestion import INGESTION_QUEUE_ENABLED, start_ingestion_workers
+        from personadjango.ingest import FILE_PROCESSED, ingest_files
+        if INGESTION_QUEUE_ENABLED:
+            start_ingestion_workers(ingest_files, FILE_PROCESSED)
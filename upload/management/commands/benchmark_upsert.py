@@ -0,0 +1,61 @@
+import os
+import time
+import random
+import shutil
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from personadjango.embeddings import (
+                                UPSERT_BATCH_SIZE,
+                                append_files_to_brain,
+                                create_embeddings
+                                )
+from personadjango.services.index import save_file_index_ranges
+
+BENCHMARK_BRAIN = 'upsert-benchmark'
+WORDS = (
+    "brain index answer question document chapter section page vector search keyword "
+    "model memory upload delete cache worker request response summary context file"
+).split()
+
+class Command(BaseCommand):
+    """
+    Measure how fast append_files_to_brain, the upload path, adds chunks to an index, one
+    chunk per upsert as before against UPSERT_BATCH_SIZE chunks per upsert.
+
+    Runs on a throwaway index and metadata folder, the configured brains are not touched.
+    The times include loading and saving the index, as an upload does.
+    """
+    help = 'Report chunks per second of appending a document to a brain, unbatched and batched.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=500, help='Number of 100 word chunks appended.')
+        parser.add_argument('--batch-size', type=int, default=UPSERT_BATCH_SIZE, help='Chunks per upsert of the batched run.')
+
+    def handle(self, *args, **options):
+        if options['chunks'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--chunks and --batch-size must be positive.')
+
+        generator = random.Random(0)
+        content = " ".join(generator.choice(WORDS) for _ in range(options['chunks'] * 100))
+        work_folder = tempfile.mkdtemp(prefix='upsert-benchmark-')
+        file_index_range = os.environ.get('FILE_INDEX_RANGE')
+        os.environ['FILE_INDEX_RANGE'] = work_folder
+        try:
+            for label, batch_size in (('unbatched', 1), ('batched', options['batch_size'])):
+                index_path = os.path.join(work_folder, label)
+                save_file_index_ranges(BENCHMARK_BRAIN, {'personality_name': 'benchmark', 'last_index': 0, 'files': {}})
+                create_embeddings('seed.txt', content[:2000], work_folder, index_path, BENCHMARK_BRAIN)
+
+                start_time = time.perf_counter()
+                try:
+                    append_files_to_brain([('document.txt', content)], index_path, BENCHMARK_BRAIN, batch_size=batch_size)
+                except Exception as e:
+                    raise CommandError(f'The {label} run failed: {e}')
+                elapsed = time.perf_counter() - start_time
+                self.stdout.write(f"{label} (batch size {batch_size}): {options['chunks']} chunks in {elapsed:.2f} s, {options['chunks'] / elapsed:.1f} chunks/s")
+        finally:
+            if file_index_range is None:
+                os.environ.pop('FILE_INDEX_RANGE', None)
+            else:
+                os.environ['FILE_INDEX_RANGE'] = file_index_range
+            shutil.rmtree(work_folder, ignore_errors=True)
@@ -0,0 +1,37 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from personadjango.services.index import read_file_index_ranges
+from personadjango.services.segments import (
+                                compact_brain,
+                                compaction_due
+                                )
+
+class Command(BaseCommand):
+    """
+    Fold the delta segments and tombstones of segmented brains into their base index.
+
+    Uploads and deletions schedule a compaction when a threshold is reached, this command
+    also catches brains that only reached SEGMENT_COMPACT_MAX_AGE, for example from cron.
+    """
+    help = 'Compact the segmented brains that reached a size or age threshold.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('brains', nargs='*', help='Brains to compact, every brain with local metadata when omitted.')
+        parser.add_argument('--force', action='store_true', help='Compact even below the thresholds.')
+
+    def handle(self, *args, **options):
+        brainNames = options['brains'] or sorted(
+            os.path.splitext(name)[0] for name in os.listdir(os.environ.get('FILE_INDEX_RANGE')) if name.endswith('.json')
+        )
+        failed = 0
+        for brainName in brainNames:
+            try:
+                if not options['force'] and not compaction_due(read_file_index_ranges(brainName)):
+                    continue
+                if compact_brain(brainName):
+                    self.stdout.write(f'{brainName}: compacted')
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{brainName}: {e}')
+        if failed:
+            raise CommandError(f'{failed} brains could not be compacted.')
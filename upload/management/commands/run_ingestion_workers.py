@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from personadjango.ingest import (
+                                FILE_PROCESSED,
+                                ingest_files
+                                )
+from personadjango.services.ingestion import (
+                                INGESTION_QUEUE_DB,
+                                start_ingestion_workers
+                                )
+
+class Command(BaseCommand):
+    """
+    Process queued uploads outside of the server processes.
+
+    Run it on the node serving the uploads with INGESTION_WORKERS=0 in the server's
+    environment, so the server workers only queue the jobs and answer status requests.
+    """
+    help = 'Run ingestion workers processing the queued uploads until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Jobs processed at the same time, one per brain.')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('At least one worker is needed.')
+
+        start_ingestion_workers(ingest_files, FILE_PROCESSED, options['workers'])
+        self.stdout.write(f"Processing uploads queued in {INGESTION_QUEUE_DB} with {options['workers']} workers.")
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped, running jobs are queued again after INGESTION_JOB_TIMEOUT.')
@@ -1,3 +1,127 @@
-from django.test import TestCase
+import os
+import time
+import tempfile
+from unittest import mock
+from django.test import SimpleTestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from personadjango.embeddings import batched_chunks
+from personadjango.services.segments import compaction_due
+from personadjango.services.ingestion import IngestionQueue
 
-# Create your tests here.
+class BatchedChunksTests(SimpleTestCase):
+    def test_chunks_are_numbered_and_split_into_batches(self):
+        word_chunks = [['one', 'two'], ['three'], ['four'], ['five'], ['six']]
+        batches = list(batched_chunks(word_chunks, 11, 2))
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][0], (11, 'one two ', 'filename'))
+        self.assertEqual([document[0] for batch in batches for document in batch], [11, 12, 13, 14, 15])
+
+    def test_exact_multiple_has_no_empty_batch(self):
+        batches = list(batched_chunks([['a'], ['b'], ['c'], ['d']], 1, 2))
+        self.assertEqual([[document[0] for document in batch] for batch in batches], [[1, 2], [3, 4]])
+
+    def test_no_chunks_yield_no_batch(self):
+        self.assertEqual(list(batched_chunks([], 1, 64)), [])
+
+@mock.patch('personadjango.services.segments.SEGMENT_COMPACT_MAX_DELTAS', 3)
+@mock.patch('personadjango.services.segments.SEGMENT_COMPACT_MAX_TOMBSTONES', 100)
+@mock.patch('personadjango.services.segments.SEGMENT_COMPACT_MAX_AGE', 3600)
+class CompactionDueTests(SimpleTestCase):
+    def segments(self, count, age=0):
+        return [{'id': str(number), 'created': time.time() - age} for number in range(count)]
+
+    def test_brain_without_segments_or_tombstones_is_not_due(self):
+        self.assertFalse(compaction_due({}))
+        self.assertFalse(compaction_due({'segments': [], 'tombstones': []}))
+
+    def test_due_at_the_segment_count(self):
+        self.assertFalse(compaction_due({'segments': self.segments(2)}))
+        self.assertTrue(compaction_due({'segments': self.segments(3)}))
+
+    def test_due_at_the_tombstoned_id_count(self):
+        self.assertFalse(compaction_due({'tombstones': [[1, 50], [60, 108]]}))
+        self.assertTrue(compaction_due({'tombstones': [[1, 50], [60, 109]]}))
+
+    def test_due_when_the_oldest_segment_is_old(self):
+        self.assertFalse(compaction_due({'segments': self.segments(1, age=60)}))
+        self.assertTrue(compaction_due({'segments': self.segments(1) + self.segments(1, age=7200)}))
+
+class IngestionQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.queue = IngestionQueue(os.path.join(self.folder.name, 'jobs.sqlite3'), os.path.join(self.folder.name, 'spool'))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def enqueue(self, brainName, *names):
+        return self.queue.enqueue(brainName, [SimpleUploadedFile(name, b'content') for name in names])
+
+    def test_claim_takes_the_oldest_job_with_its_spooled_files(self):
+        job_id = self.enqueue('brain', 'a.txt', 'a.txt')
+        claimed_id, brainName, files = self.queue.claim('worker-1')
+
+        self.assertEqual((claimed_id, brainName), (job_id, 'brain'))
+        self.assertEqual([(position, filename) for position, filename, _ in files], [(0, 'a.txt'), (1, 'a.txt')])
+        self.assertEqual(len({path for _, _, path in files}), 2)
+        self.assertEqual(self.queue.job(job_id)['status'], 'running')
+        self.assertIsNone(self.queue.claim('worker-2'))
+
+    def test_one_running_job_per_brain(self):
+        first = self.enqueue('brain', 'a.txt')
+        second = self.enqueue('brain', 'b.txt')
+        other = self.enqueue('other', 'c.txt')
+
+        self.assertEqual(self.queue.claim('worker-1')[0], first)
+        self.assertEqual(self.queue.claim('worker-2')[0], other)
+        self.assertIsNone(self.queue.claim('worker-3'))
+        self.queue.finish_job(first, 'worker-1')
+        self.assertEqual(self.queue.claim('worker-3')[0], second)
+
+    def test_finished_job_reports_progress_and_removes_its_files(self):
+        job_id = self.enqueue('brain', 'a.txt', 'b.pdf')
+        self.queue.claim('worker-1')
+
+        self.assertTrue(self.queue.finish_file(job_id, 'worker-1', 0, None, 1.5))
+        self.assertEqual(self.queue.job(job_id)['files'][1]['status'], 'running')
+        self.assertTrue(self.queue.finish_file(job_id, 'worker-1', 1, 'Unsupported file format', 0.1))
+        self.assertTrue(self.queue.finish_job(job_id, 'worker-1'))
+
+        job = self.queue.job(job_id)
+        self.assertEqual(job['status'], 'finished')
+        self.assertEqual(job['progress'], {'total': 2, 'done': 2, 'failed': 1})
+        self.assertEqual(job['files'][1]['error'], 'Unsupported file format')
+        self.assertFalse(os.path.exists(os.path.join(self.queue.spool_dir, job_id)))
+        self.assertIsNone(self.queue.job('missing'))
+
+    def test_job_without_heartbeat_is_requeued_without_its_processed_files(self):
+        job_id = self.enqueue('brain', 'a.txt', 'b.txt')
+        self.queue.claim('worker-1')
+        self.queue.finish_file(job_id, 'worker-1', 0, None, 1.0)
+
+        with mock.patch('personadjango.services.ingestion.INGESTION_JOB_TIMEOUT', -1):
+            claimed_id, _, files = self.queue.claim('worker-2')
+
+        self.assertEqual(claimed_id, job_id)
+        self.assertEqual([position for position, _, _ in files], [1])
+
+        # The first worker lost the job, its late reports are ignored
+        self.assertFalse(self.queue.heartbeat(job_id, 'worker-1'))
+        self.assertFalse(self.queue.finish_file(job_id, 'worker-1', 1, 'Error processing file', 1.0))
+        self.assertFalse(self.queue.finish_job(job_id, 'worker-1', 'Error processing file'))
+        self.assertEqual(self.queue.job(job_id)['status'], 'running')
+        self.assertTrue(os.path.exists(os.path.join(self.queue.spool_dir, job_id)))
+
+        self.assertTrue(self.queue.heartbeat(job_id, 'worker-2'))
+        self.assertTrue(self.queue.finish_file(job_id, 'worker-2', 1, None, 1.0))
+        self.assertTrue(self.queue.finish_job(job_id, 'worker-2'))
+        self.assertEqual(self.queue.job(job_id)['progress'], {'total': 2, 'done': 2, 'failed': 0})
+
+    def test_running_job_with_heartbeat_is_not_requeued(self):
+        job_id = self.enqueue('brain', 'a.txt')
+        self.queue.claim('worker-1')
+        self.assertTrue(self.queue.heartbeat(job_id, 'worker-1'))
+
+        self.assertIsNone(self.queue.claim('worker-2'))
+        self.assertTrue(self.queue.finish_job(job_id, 'worker-1'))
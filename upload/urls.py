@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path('start', views.upload_file, name='upload'),
+    path('status/<str:job_id>', views.upload_status, name='upload_status'),
 ]